@@ -0,0 +1,366 @@
+import atexit
+import copy
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from metrics import incr
+
+# config 저장소. 기본은 지금처럼 config.json 파일 하나, CONFIG_BACKEND=sqlite 면 SQLite(WAL) 에 행 단위로 저장
+# 어느 쪽이든 세션은 "마지막으로 읽은/쓴 상태(행 스냅샷)" 와 비교해 바뀐 행만 반영하므로
+# 동시에 열린 세션이 서로 다른 지침 set 을 고쳐도 상대의 변경을 덮어쓰지 않음
+# 읽은 결과는 프로세스 안에서 공유(파일 mtime/크기, DB 버전으로 검증)하고, version() 이 바뀌면 다른 곳에서 고쳐진 것
+CONFIG_BACKEND = os.getenv("CONFIG_BACKEND", "json")
+CONFIG_DB_PATH = os.getenv("CONFIG_DB_PATH", "config.sqlite3")
+# JSON 파일: 이 시간(초) 안에 들어온 저장은 한 번의 쓰기로 모음 (0 이면 즉시 씀)
+CONFIG_SAVE_DELAY = float(os.getenv("CONFIG_SAVE_DELAY", "1.0"))
+# 쓰기 직전 파일을 config.json.bak1 ~ bakN 으로 돌려가며 보관
+CONFIG_BACKUPS = 3
+
+# 목록 안의 항목 하나하나를 행으로 나누는 키 (id 로 구분, 순서는 별도 행)
+SET_KEYS = ("instruction_sets", "image_instruction_sets")
+HISTORY_KEY = "history"
+
+
+def config_rows(data: dict) -> dict:
+    # config dict → {(범위, 키): JSON 문자열}. 비교와 저장은 모두 이 행 단위로 함
+    rows = {}
+    for key, value in data.items():
+        if key in SET_KEYS and isinstance(value, list):
+            ids = []
+            for i, set_obj in enumerate(value):
+                set_id = str(set_obj.get("id") or f"#{i}")
+                ids.append(set_id)
+                rows[(key, set_id)] = json.dumps(set_obj, ensure_ascii=False, sort_keys=True)
+            rows[("order", key)] = json.dumps(ids, ensure_ascii=False)
+        elif key == HISTORY_KEY and isinstance(value, list):
+            for i, text in enumerate(value):
+                rows[(HISTORY_KEY, str(i))] = json.dumps(text, ensure_ascii=False)
+            rows[("order", HISTORY_KEY)] = json.dumps(len(value))
+        else:
+            rows[("setting", key)] = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return rows
+
+
+def rows_to_config(rows: dict) -> dict:
+    data = {}
+    for (scope, key), raw in rows.items():
+        if scope == "setting":
+            data[key] = json.loads(raw)
+    for key in SET_KEYS:
+        order = rows.get(("order", key))
+        if order is None:
+            continue
+        data[key] = [json.loads(rows[(key, i)]) for i in json.loads(order) if (key, i) in rows]
+    order = rows.get(("order", HISTORY_KEY))
+    if order is not None:
+        data[HISTORY_KEY] = [
+            json.loads(rows[(HISTORY_KEY, str(i))])
+            for i in range(json.loads(order))
+            if (HISTORY_KEY, str(i)) in rows
+        ]
+    return data
+
+
+def diff_rows(base: dict, rows: dict):
+    # base 이후 이 세션이 바꾼 행 / 지운 행
+    changed = {k: v for k, v in rows.items() if base.get(k) != v}
+    deleted = [k for k in base if k not in rows]
+    return changed, deleted
+
+
+class JsonConfigStore:
+    def __init__(self, path: str, delay: float = CONFIG_SAVE_DELAY, backups: int = CONFIG_BACKUPS):
+        self.path = path
+        self.delay = delay
+        self.backups = backups
+        # 같은 프로세스의 세션(스레드)끼리 읽기-수정-쓰기가 겹치지 않게 함
+        self._lock = threading.Lock()
+        # 아직 파일에 쓰지 않은 행 변경 (None 은 삭제)
+        self._pending = {}
+        self._timer = None
+        # 파싱해 둔 파일 내용과 그때의 (mtime, 크기). 다른 프로세스/손으로 고치면 크기나 mtime 이 바뀜
+        self._cache = None
+        self._signature = None
+        self._version = 0
+        atexit.register(self.flush)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh_locked(self):
+        signature = self._stat()
+        if signature != self._signature:
+            self._signature = signature
+            self._cache = None
+            self._version += 1
+
+    def _cached(self) -> dict:
+        self._refresh_locked()
+        if self._cache is None:
+            self._cache = self._read()
+            self._signature = self._stat()
+        return self._cache
+
+    def _backup_path(self, n: int) -> str:
+        return f"{self.path}.bak{n}"
+
+    def _parse(self, path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        data = self._parse(self.path)
+        if data is not None:
+            return data
+        # 쓰다 만 파일 등으로 깨져 있으면 백업에서 복구. 깨진 파일은 확인용으로 옮겨 두고 백업 순환에서 뺌
+        for n in range(1, self.backups + 1):
+            data = self._parse(self._backup_path(n))
+            if data is not None:
+                os.replace(self.path, f"{self.path}.corrupt")
+                shutil.copy2(self._backup_path(n), self.path)
+                incr("config.recovered")
+                return data
+        return {}
+
+    def _rotate_backups(self):
+        if not os.path.exists(self.path) or self.backups <= 0:
+            return
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._backup_path(n)):
+                os.replace(self._backup_path(n), self._backup_path(n + 1))
+        shutil.copy2(self.path, self._backup_path(1))
+
+    def _write(self, data: dict):
+        # 임시 파일에 다 쓰고 fsync 한 뒤 rename → 중간에 죽어도 config.json 은 이전 내용 그대로
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            self._rotate_backups()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # 방금 쓴 내용이 곧 최신 캐시
+        self._cache = data
+        self._signature = self._stat()
+        incr("config.writes")
+        # rename 자체도 디스크에 남도록 디렉터리까지 fsync (지원하지 않는 OS 는 건너뜀)
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def _current_rows(self) -> dict:
+        rows = config_rows(self._cached())
+        for key, value in self._pending.items():
+            if value is None:
+                rows.pop(key, None)
+            else:
+                rows[key] = value
+        return rows
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        rows = self._current_rows()
+        self._pending = {}
+        self._write(rows_to_config(rows))
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def load(self) -> dict:
+        # 세션이 받은 목록을 제자리에서 고치므로 공유 캐시는 복사해서 넘김
+        with self._lock:
+            if not self._pending:
+                return copy.deepcopy(self._cached())
+            return rows_to_config(self._current_rows())
+
+    def version(self) -> int:
+        with self._lock:
+            self._refresh_locked()
+            return self._version
+
+    def save(self, data: dict, base: dict = None) -> dict:
+        # 바뀐 행이 없으면 디스크를 건드리지 않음. 바뀐 행은 모아 두었다가 delay 뒤 한 번에 씀
+        rows = config_rows(data)
+        changed, deleted = diff_rows(base or {}, rows)
+        if not changed and not deleted:
+            incr("config.saves_skipped")
+            return rows
+        with self._lock:
+            self._pending.update(changed)
+            for key in deleted:
+                self._pending[key] = None
+            self._version += 1
+            if self.delay <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return rows
+
+    def replace(self, data: dict):
+        # config.json 불러오기: 전체 교체
+        with self._lock:
+            self._pending = {}
+            self._flush_locked()
+            self._write(data)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            self._flush_locked()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._cache = None
+            self._refresh_locked()
+
+
+class SqliteConfigStore:
+    def __init__(self, path: str, legacy_json_path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        # (버전, 읽은 내용). 쓰기마다 config_meta.version 을 올리므로 다른 프로세스의 변경도 알아챔
+        self._cache = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS config_rows (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (scope, key)
+                )"""
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS config_meta (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO config_meta (id, version) VALUES (0, 0)")
+            empty = conn.execute("SELECT COUNT(*) FROM config_rows").fetchone()[0] == 0
+        # 처음 전환할 때 기존 config.json 내용을 옮겨 옴
+        if empty and legacy_json_path:
+            legacy = JsonConfigStore(legacy_json_path).load()
+            if legacy:
+                self.replace(legacy)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump(self, conn):
+        conn.execute("UPDATE config_meta SET version = version + 1 WHERE id = 0")
+
+    def version(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT version FROM config_meta WHERE id = 0").fetchone()[0]
+
+    def load(self) -> dict:
+        with self._connect() as conn:
+            version = conn.execute("SELECT version FROM config_meta WHERE id = 0").fetchone()[0]
+            cached = self._cache
+            if cached is None or cached[0] != version:
+                rows = {(scope, key): value for scope, key, value in conn.execute(
+                    "SELECT scope, key, value FROM config_rows"
+                )}
+                cached = (version, rows_to_config(rows))
+                self._cache = cached
+        return copy.deepcopy(cached[1])
+
+    def save(self, data: dict, base: dict = None) -> dict:
+        # 바뀐 행만 한 트랜잭션으로 반영 (지침 필드 하나를 고치면 그 set 한 행만 씀)
+        rows = config_rows(data)
+        changed, deleted = diff_rows(base or {}, rows)
+        if not changed and not deleted:
+            incr("config.saves_skipped")
+            return rows
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO config_rows (scope, key, value) VALUES (?, ?, ?)",
+                [(scope, key, value) for (scope, key), value in changed.items()],
+            )
+            conn.executemany("DELETE FROM config_rows WHERE scope = ? AND key = ?", deleted)
+            self._bump(conn)
+        incr("config.writes")
+        return rows
+
+    def replace(self, data: dict):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM config_rows")
+            conn.executemany(
+                "INSERT INTO config_rows (scope, key, value) VALUES (?, ?, ?)",
+                [(scope, key, value) for (scope, key), value in config_rows(data).items()],
+            )
+            self._bump(conn)
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM config_rows")
+            self._bump(conn)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(json_path: str):
+    # 페이지마다 CONFIG_PATH 를 넘김. 같은 경로는 프로세스 안에서 저장소 하나를 공유
+    with _stores_lock:
+        store = _stores.get(json_path)
+        if store is None:
+            if CONFIG_BACKEND == "sqlite":
+                store = SqliteConfigStore(CONFIG_DB_PATH, legacy_json_path=json_path)
+            else:
+                store = JsonConfigStore(json_path)
+            _stores[json_path] = store
+        return store
+
+
+def is_history_row(row_key) -> bool:
+    scope, key = row_key
+    return scope == HISTORY_KEY or (scope == "order" and key == HISTORY_KEY)
+
+
+def changed_rows(data: dict, snapshot: dict) -> bool:
+    # 저장소 내용 중 이 페이지가 쓰는 키(snapshot 에 있는 키)가 세션이 마지막으로 본 것과 다른지
+    # 최근 입력(history)은 어느 세션이든 생성할 때마다 바뀌므로 "다른 곳에서 설정이 바뀜" 판단에서 뺌
+    keys = {key for scope, key in snapshot if scope in ("setting", "order") and key != HISTORY_KEY}
+    theirs = config_rows({k: v for k, v in data.items() if k in keys})
+    return any(snapshot.get(k) != v for k, v in theirs.items())
@@ -0,0 +1,369 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import incr
+from prompt_builder import prompt_cache_key
+from rate_limit import estimate_request_tokens, run_scheduled
+from resilience import call_with_fallback
+from response_cache import get_response_cache, make_cache_key
+from singleflight import SingleFlight
+
+# 스트리밍 중 화면 갱신 최소 간격(초) - 토큰마다 다시 그리면 websocket 부하가 커짐
+RENDER_INTERVAL = 0.05
+
+# finish_reason == "length" 로 잘린 응답을 이어 받는 최대 횟수
+MAX_CONTINUATIONS = 3
+CONTINUE_PROMPT = (
+    "출력이 길이 제한으로 중간에 끊겼어. 끊긴 지점 바로 다음부터 같은 형식으로 이어서 작성해줘. "
+    "이미 출력한 내용은 다시 쓰지 마."
+)
+# 이어쓰기 결과와 앞 결과의 겹치는 줄을 찾을 때 비교하는 최대 줄 수
+STITCH_WINDOW_LINES = 20
+STITCH_MIN_OVERLAP = 12
+
+# 프로세스 전체에서 진행 중인 동일 요청(캐시 키 기준)을 합치는 레지스트리
+_inflight = SingleFlight("singleflight")
+
+
+def build_messages(system_text: str, user_text: str) -> list:
+    return [
+        {"role": "system", "content": system_text},
+        {"role": "user", "content": user_text},
+    ]
+
+
+def usage_to_dict(usage) -> dict:
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        # 프롬프트 캐시(앞부분이 같은 최근 요청)에서 재사용된 입력 토큰
+        "cached_tokens": getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0,
+    }
+
+
+def merge_usage(a: dict, b: dict) -> dict:
+    merged = dict(a or {})
+    for key, value in (b or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def stitch(previous: str, addition: str) -> str:
+    # 이어쓰기 응답을 앞 응답 뒤에 붙이되, 모델이 다시 쓴 줄은 한 번만 남김
+    if not previous:
+        return addition
+    if not addition:
+        return previous
+    body = previous.rstrip("\n")
+    line_closed = body != previous
+    prev_lines = body.split("\n")
+    add_lines = addition.lstrip("\n").split("\n")
+
+    # 1) 앞 응답의 마지막 k줄을 그대로 반복한 경우
+    for k in range(min(len(prev_lines), len(add_lines), STITCH_WINDOW_LINES), 0, -1):
+        prev_tail = [line.strip() for line in prev_lines[-k:]]
+        add_head = [line.strip() for line in add_lines[:k]]
+        if prev_tail == add_head and any(add_head):
+            return "\n".join(prev_lines + add_lines[k:])
+
+    # 2) 끊긴 마지막 줄을 처음부터 다시 쓴 경우
+    tail = prev_lines[-1].strip()
+    if not line_closed and tail and add_lines[0].strip().startswith(tail):
+        return "\n".join(prev_lines[:-1] + add_lines)
+
+    # 3) 끊긴 줄의 끝부분을 조금 겹쳐서 다시 쓴 경우 (짧은 우연한 일치는 무시)
+    if not line_closed:
+        head = add_lines[0]
+        for n in range(min(len(prev_lines[-1]), len(head), 200), STITCH_MIN_OVERLAP - 1, -1):
+            if prev_lines[-1].endswith(head[:n]):
+                return previous + addition.lstrip("\n")[n:]
+
+    # 4) 끊긴 지점에서 바로 이어 쓴 경우
+    return previous + addition
+
+
+def _request_options(response_format) -> dict:
+    return {"response_format": response_format} if response_format else {}
+
+
+def _record_prompt_cache(result: dict) -> dict:
+    # 프로세스 전체 프롬프트 캐시 적중률과, 적중/미적중 호출의 첫 토큰 시간을 따로 누적
+    usage = result.get("usage") or {}
+    if usage.get("prompt_tokens"):
+        incr("prompt.tokens", usage["prompt_tokens"])
+        incr("prompt.cached_tokens", usage.get("cached_tokens", 0))
+        kind = "cached" if usage.get("cached_tokens") else "uncached"
+        incr(f"prompt.{kind}_calls")
+        incr(f"prompt.{kind}_ttft_ms", int(result.get("ttft", 0) * 1000))
+    return result
+
+
+def _cache_options(messages: list) -> dict:
+    # 같은 system 프롬프트 요청을 같은 캐시로 보내도록 prompt_cache_key 를 함께 보냄
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    return {"extra_body": {"prompt_cache_key": prompt_cache_key(system)}} if system else {}
+
+
+def complete(client, model: str, messages: list, max_tokens: int, response_format: dict = None) -> dict:
+    # 모든 호출은 모델별 RPM/TPM 스케줄러를 거침 (한도 초과 시 실패 대신 대기)
+    # 시도마다 출력량(max_tokens)에 맞춘 마감 시간을 두고 일시적 오류는 백오프 재시도, 비스트리밍 호출은 느리면 헤지
+    # 모델 회로가 열려 있거나 재시도가 모두 실패하면 다음 모델로 대체
+    estimated = estimate_request_tokens(messages, max_tokens)
+
+    def attempt(candidate, timeout):
+        return run_scheduled(
+            candidate, estimated,
+            lambda: _complete(client, candidate, messages, max_tokens, response_format, timeout),
+        )
+
+    return _record_prompt_cache(call_with_fallback(model, attempt, hedge=True, max_tokens=max_tokens))
+
+
+def stream_complete(client, model: str, messages: list, max_tokens: int, on_delta=None,
+                    response_format: dict = None) -> dict:
+    estimated = estimate_request_tokens(messages, max_tokens)
+
+    def attempt(candidate, timeout):
+        return run_scheduled(
+            candidate, estimated,
+            lambda: _stream_complete(client, candidate, messages, max_tokens, on_delta, response_format, timeout),
+        )
+
+    return _record_prompt_cache(call_with_fallback(model, attempt, max_tokens=max_tokens))
+
+
+def _complete(client, model: str, messages: list, max_tokens: int, response_format: dict = None,
+              timeout: float = None) -> dict:
+    started = time.perf_counter()
+    res = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        **_request_options(response_format),
+        **_cache_options(messages),
+    )
+    latency = time.perf_counter() - started
+    choice = res.choices[0]
+    return {
+        "text": choice.message.content or "",
+        "finish_reason": choice.finish_reason,
+        "model": getattr(res, "model", None) or model,
+        "usage": usage_to_dict(res.usage),
+        # 비스트리밍 호출은 전체 응답이 한 번에 도착하므로 첫 토큰 시간 = 전체 시간
+        "ttft": latency,
+        "latency": latency,
+    }
+
+
+def _stream_complete(client, model: str, messages: list, max_tokens: int, on_delta=None,
+                     response_format: dict = None, timeout: float = None) -> dict:
+    started = time.perf_counter()
+    first_token_at = None
+    last_render = 0.0
+    pieces = []
+    finish_reason = None
+    usage = None
+    answered_model = model
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+        timeout=timeout,
+        **_request_options(response_format),
+        **_cache_options(messages),
+    )
+    for chunk in stream:
+        if getattr(chunk, "model", None):
+            answered_model = chunk.model
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta.content if choice.delta else None
+        if delta:
+            now = time.perf_counter()
+            if first_token_at is None:
+                first_token_at = now
+            pieces.append(delta)
+            if on_delta and now - last_render >= RENDER_INTERVAL:
+                on_delta("".join(pieces))
+                last_render = now
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+
+    text = "".join(pieces)
+    if on_delta:
+        on_delta(text)
+
+    finished = time.perf_counter()
+    return {
+        "text": text,
+        "finish_reason": finish_reason,
+        "model": answered_model,
+        "usage": usage_to_dict(usage),
+        "ttft": (first_token_at or finished) - started,
+        "latency": finished - started,
+    }
+
+
+def run_chat(client, model: str, system_text: str, user_text: str, max_tokens: int,
+             stream: bool = False, on_delta=None, use_cache: bool = True,
+             auto_continue: bool = True, response_format: dict = None) -> dict:
+    cache = get_response_cache()
+    cache_key = make_cache_key(system_text, user_text, model, max_tokens, response_format)
+    # JSON 스키마 응답은 이어쓰기를 요청해도 같은 max_tokens 안에서 문서를 처음부터 다시 쓰므로 더 나아가지 못함
+    # → 이어쓰지 않고 잘린 채로 돌려줘 경고를 띄움
+    if response_format:
+        auto_continue = False
+
+    # use_cache=False 는 "캐시 우회": 조회는 건너뛰지만 새 응답으로 캐시를 갱신
+    if use_cache:
+        started = time.perf_counter()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            elapsed = time.perf_counter() - started
+            cached.update({"cache_hit": True, "ttft": elapsed, "latency": elapsed})
+            if on_delta:
+                on_delta(cached["text"])
+            return cached
+
+    # 같은 요청이 다른 세션에서 이미 진행 중이면 그 호출 결과를 함께 받음 (업스트림 호출 1회)
+    result, shared = _inflight.do(
+        cache_key,
+        lambda emit: _generate(client, model, system_text, user_text, max_tokens, stream, emit,
+                               auto_continue, response_format, cache, cache_key),
+        on_delta,
+    )
+    result["cache_hit"] = False
+    result["coalesced"] = shared
+    return result
+
+
+def _generate(client, model: str, system_text: str, user_text: str, max_tokens: int, stream: bool,
+              on_delta, auto_continue: bool, response_format, cache, cache_key: str) -> dict:
+    messages = build_messages(system_text, user_text)
+
+    def call(msgs, emit):
+        if stream:
+            return stream_complete(client, model, msgs, max_tokens, on_delta=emit,
+                                   response_format=response_format)
+        res = complete(client, model, msgs, max_tokens, response_format=response_format)
+        if emit:
+            emit(res["text"])
+        return res
+
+    result = call(messages, on_delta)
+    text = result["text"]
+    continuations = 0
+    # 잘린 응답은 지금까지의 출력을 assistant 메시지로 넘겨 이어서 받음 (전체 재실행 대비 토큰/시간 절약)
+    while auto_continue and result["finish_reason"] == "length" and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        cont_messages = messages + [
+            {"role": "assistant", "content": text},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+        emit = (lambda partial, base=text: on_delta(stitch(base, partial))) if on_delta else None
+        part = call(cont_messages, emit)
+        text = stitch(text, part["text"])
+        result["usage"] = merge_usage(result["usage"], part["usage"])
+        result["latency"] += part["latency"]
+        result["queued"] = result.get("queued", 0) + part.get("queued", 0)
+        result["attempts"] = result.get("attempts", []) + part.get("attempts", [])
+        if part.get("fallback_from"):
+            result["fallback_from"] = part["fallback_from"]
+        result["finish_reason"] = part["finish_reason"]
+    result["text"] = text
+    result["continuations"] = continuations
+
+    # 잘린 응답(length)과 대체 모델이 답한 응답은 캐시하지 않음 (선택 모델의 키로 남기지 않음)
+    if result["finish_reason"] == "stop" and not result.get("fallback_from"):
+        cache.put(cache_key, result)
+    return result
+
+
+def fan_out(fn, items: list, max_workers: int, on_result=None) -> list:
+    # items 를 제한된 스레드 풀에서 병렬 처리하고, 입력 순서대로 결과를 돌려줌
+    # on_result(index, result) 는 호출한 스레드(Streamlit 스크립트 스레드)에서 실행되므로 st.* 사용 가능
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as exc:
+                results[i] = exc
+            if on_result:
+                on_result(i, results[i])
+    return results
+
+
+def format_metrics(result: dict) -> str:
+    if not result:
+        return ""
+    if result.get("cache_hit"):
+        return f"⚡ 캐시 응답 ({result.get('latency', 0) * 1000:.0f}ms) · API 호출 없음"
+    if result.get("history_id"):
+        return f"📜 저장된 기록 #{result['history_id']} · {result.get('model') or '-'} · API 호출 없음"
+    parts = [f"⏱ 첫 토큰 {result.get('ttft', 0):.2f}s", f"전체 {result.get('latency', 0):.2f}s"]
+    if result.get("model"):
+        parts.insert(0, f"🤖 {result['model']}")
+    if result.get("fallback_from"):
+        parts.insert(1, f"↪ {result['fallback_from']} 대신 대체 모델 응답")
+    elif result.get("fallbacks"):
+        parts.insert(1, f"↪ 대체 모델 응답 {result['fallbacks']}건")
+    if result.get("coalesced"):
+        parts.insert(0, "🔗 동일 요청 결과 공유")
+    route = result.get("route")
+    if route:
+        parts.append(f"🧭 {route['reason']} · max_tokens {route['max_tokens']}")
+        if route.get("requested") and route["requested"] != route["model"]:
+            # 자동 선택이 사용자가 고른 모델을 바꿨으면 드러냄
+            parts.append(f"선택한 {route['requested']} 대신 {route['model']} 자동 선택")
+    if result.get("instruction_hash"):
+        parts.append(f"지침 {result['instruction_hash'][:8]}")
+    attempts = result.get("attempts") or []
+    retries = sum(1 for a in attempts if a["outcome"] not in ("ok", "hedged"))
+    if retries:
+        parts.append(f"재시도 {retries}회")
+    if any(a["outcome"] == "hedged" for a in attempts):
+        parts.append("헤지 응답")
+    if result.get("queued", 0) >= 0.1:
+        parts.append(f"한도 대기 {result['queued']:.1f}s")
+    usage = result.get("usage") or {}
+    if usage.get("prompt_tokens"):
+        parts.append(f"입력 캐시 {usage.get('cached_tokens', 0) / usage['prompt_tokens'] * 100:.0f}%")
+    if usage.get("completion_tokens"):
+        parts.append(f"출력 {usage['completion_tokens']} 토큰")
+    if result.get("continuations"):
+        parts.append(f"이어쓰기 {result['continuations']}회")
+    if result.get("finish_reason") == "length":
+        if result.get("structured"):
+            parts.append("⚠️ 출력이 잘렸습니다 (JSON 모드는 이어쓰기 불가 · 문장 분할/긴 대본 모드를 쓰세요)")
+        else:
+            parts.append("⚠️ 출력이 잘렸습니다")
+    if result.get("windows"):
+        parts.append(f"구간 {result['windows']}개")
+    if result.get("incremental"):
+        inc = result["incremental"]
+        parts.append(f"♻️ 바뀐 문장 {inc['regenerated']}개만 생성 · {inc['reused']}개 재사용")
+    if result.get("tm"):
+        tm = result["tm"]
+        rate = tm["hits"] / tm["lookups"] * 100
+        fuzzy = f", 유사 {tm['fuzzy']}" if tm.get("fuzzy") else ""
+        parts.append(f"🧠 번역 메모리 {tm['hits']}/{tm['lookups']}문장 ({rate:.0f}%{fuzzy})")
+    if result.get("sentences"):
+        parts.append(f"문장 {result['sentences']}개 · 호출 {result.get('calls', 0)}회")
+    if result.get("failed"):
+        parts.append(f"실패 {result['failed']}건")
+    return " · ".join(parts)
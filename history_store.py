@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 생성 기록 저장소: 입력/출력 전문과 메타데이터(모델, 지침 해시, 토큰, 지연)를 추가만 하는(append-only) SQLite 테이블에 남김
+# FTS5 전문 색인으로 수천 건도 바로 검색하고, 결과를 API 호출 없이 다시 열 수 있음
+HISTORY_PATH = os.getenv("HISTORY_DB_PATH", ".history.sqlite3")
+# 최근 입력/검색 결과 목록에 보여줄 미리보기 길이
+PREVIEW_CHARS = 80
+# trigram 토크나이저는 3글자 미만 검색어를 찾지 못하므로 그때는 LIKE 로 찾음
+TRIGRAM_MIN_CHARS = 3
+
+
+def make_preview(text: str, limit: int = PREVIEW_CHARS) -> str:
+    flat = " ".join((text or "").split())
+    return flat if len(flat) <= limit else flat[:limit] + "…"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class HistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created REAL NOT NULL,
+                    page TEXT NOT NULL,
+                    input TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    model TEXT,
+                    instruction_hash TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    latency REAL,
+                    meta TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_page_created ON runs(page, created)")
+            # 최근 입력 전문: config 에는 내용 해시와 미리보기만 두고 전문은 여기(내용 해시 → 텍스트)에 한 번만 저장
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS texts (
+                    hash TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    created REAL NOT NULL
+                )"""
+            )
+            self.fts = self._create_fts(conn)
+
+    def _create_fts(self, conn) -> str:
+        # 한국어는 띄어쓰기 단위로 잘리지 않으므로 부분 문자열을 찾는 trigram 우선, 없으면 unicode61, 둘 다 없으면 LIKE
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5("
+                    f"input, output, content='runs', content_rowid='id', tokenize='{tokenizer}')"
+                )
+            except sqlite3.OperationalError:
+                continue
+            conn.execute(
+                """CREATE TRIGGER IF NOT EXISTS runs_fts_insert AFTER INSERT ON runs BEGIN
+                    INSERT INTO runs_fts (rowid, input, output) VALUES (new.id, new.input, new.output);
+                END"""
+            )
+            sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'runs_fts'"
+            ).fetchone()[0]
+            return "trigram" if "trigram" in sql else "unicode61"
+        return ""
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, page: str, input_text: str, output_text: str, meta: dict) -> int:
+        usage = meta.get("usage") or {}
+        with self._lock, self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO runs (created, page, input, output, model, instruction_hash, "
+                "prompt_tokens, completion_tokens, latency, meta) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    page,
+                    input_text,
+                    output_text,
+                    meta.get("model"),
+                    meta.get("instruction_hash"),
+                    usage.get("prompt_tokens"),
+                    usage.get("completion_tokens"),
+                    meta.get("latency"),
+                    json.dumps(meta, ensure_ascii=False, default=str),
+                ),
+            )
+            return cur.lastrowid
+
+    def put_text(self, text: str) -> str:
+        key = text_hash(text)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO texts (hash, text, created) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+        return key
+
+    def get_text(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT text FROM texts WHERE hash = ?", (key,)).fetchone()
+        return row["text"] if row is not None else None
+
+    def _summary(self, row) -> dict:
+        return {
+            "id": row["id"],
+            "created": row["created"],
+            "page": row["page"],
+            "preview": make_preview(row["input"]),
+            "model": row["model"],
+            "instruction_hash": row["instruction_hash"],
+            "completion_tokens": row["completion_tokens"],
+            "latency": row["latency"],
+        }
+
+    def search(self, query: str, page: str = None, limit: int = 20) -> list:
+        # 검색어가 없으면 최근 기록, 있으면 입력/출력 전문 검색 (최신순)
+        query = (query or "").strip()
+        columns = "runs.id, runs.created, runs.page, runs.input, runs.model, runs.instruction_hash, " \
+                  "runs.completion_tokens, runs.latency"
+        where, params = [], []
+        if page:
+            where.append("runs.page = ?")
+            params.append(page)
+        use_fts = self.fts and query and (self.fts != "trigram" or len(query) >= TRIGRAM_MIN_CHARS)
+        if use_fts:
+            # 검색어를 하나의 구문으로 감싸 FTS 문법(AND/OR/따옴표 등)으로 해석되지 않게 함
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = f"SELECT {columns} FROM runs_fts JOIN runs ON runs.id = runs_fts.rowid WHERE runs_fts MATCH ?"
+            params.insert(0, phrase)
+            if where:
+                sql += " AND " + " AND ".join(where)
+        else:
+            sql = f"SELECT {columns} FROM runs"
+            if query:
+                where.append("(runs.input LIKE ? OR runs.output LIKE ?)")
+                params += [f"%{query}%", f"%{query}%"]
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY runs.id DESC LIMIT ?"
+        params.append(int(limit))
+        with self._connect() as conn:
+            return [self._summary(row) for row in conn.execute(sql, params)]
+
+    def get(self, run_id: int):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "created": row["created"],
+            "page": row["page"],
+            "input": row["input"],
+            "output": row["output"],
+            "meta": json.loads(row["meta"]),
+        }
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        return {"runs": count, "fts": self.fts or "없음"}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore(HISTORY_PATH)
+        return _store
+
+
+def history_meta(result: dict) -> dict:
+    # 다시 열 때 결과 영역/지표를 그대로 복원할 수 있도록 결과 dict 중 직렬화 가능한 부분만 남김
+    keep = (
+        "model", "usage", "latency", "ttft", "finish_reason", "route", "instruction_hash", "pairs",
+        "analysis", "wrapper", "format_issues", "windows", "sentences", "calls", "failed", "fallbacks",
+        "incremental", "tm",
+    )
+    return {key: result[key] for key in keep if result.get(key) is not None}
+
+
+def recent_entry(item):
+    # config 의 최근 입력 항목 하나. 예전 형식(전문 문자열)은 전문을 저장소로 옮기고 해시/미리보기로 바꿈
+    if isinstance(item, dict) and isinstance(item.get("hash"), str):
+        return {"hash": item["hash"], "preview": str(item.get("preview", ""))}
+    if isinstance(item, str) and item.strip():
+        return {"hash": get_history_store().put_text(item), "preview": make_preview(item)}
+    return None
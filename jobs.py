@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+# 생성 작업을 Streamlit 스크립트 스레드 밖(프로세스 공용 워커 풀)에서 실행
+# 작업 함수 안에서는 st.* / st.session_state 를 쓰면 안 됨 → 필요한 값은 제출 전에 스냅샷으로 넘김
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# 끝난 작업을 메모리에 남겨두는 시간(초)
+JOB_TTL_SECONDS = 3600
+
+
+class Job:
+    def __init__(self, label: str):
+        self.id = uuid4().hex[:12]
+        self.label = label
+        self.state = "queued"  # queued / running / done / error
+        self.progress = None  # 0.0 ~ 1.0, 알 수 없으면 None
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def set_partial(self, text: str):
+        self.partial = text
+
+    def set_progress(self, done: int, total: int):
+        self.progress = done / total if total else None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - (self.started or self.created)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="gen-job")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def _run(job: Job, fn):
+    job.state = "running"
+    job.started = time.time()
+    try:
+        job.result = fn(job)
+        job.state = "done"
+    except Exception as exc:
+        job.error = str(exc) or exc.__class__.__name__
+        job.state = "error"
+    finally:
+        job.finished = time.time()
+
+
+def _cleanup(now: float):
+    expired = [
+        job_id
+        for job_id, job in _jobs.items()
+        if job.finished and now - job.finished > JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def submit_job(label: str, fn) -> Job:
+    # fn(job) 은 워커 스레드에서 실행되고, 반환값이 job.result 가 됨
+    job = Job(label)
+    with _lock:
+        _cleanup(time.time())
+        _jobs[job.id] = job
+    _executor.submit(_run, job, fn)
+    return job
+
+
+def get_job(job_id: str):
+    with _lock:
+        return _jobs.get(job_id)
@@ -1,17 +1,55 @@
 import streamlit as st
-from openai import OpenAI
 import os
 import json
-from json import JSONDecodeError
+import time
+
+from config_store import get_config_store
+from generation import format_metrics
+from history_store import get_history_store, history_meta, make_preview, recent_entry
+from metrics import get_metrics
+from openai_client import get_client
+from page_common import (
+    init_shared_config,
+    render_config_watch,
+    set_config_snapshot,
+    submit_generation_job,
+    render_job_panel,
+    render_service_stats,
+)
+from prompt_builder import compile_system_prompt
+from router import route_request, plan_output_tokens
+from structured_output import pairs_to_csv
+from token_count import count_tokens, section_budget
+from translation_memory import get_translation_memory, TM_THRESHOLD
+from visual_pipeline import (
+    execute_request,
+    incremental_base,
+    COMPACT_WRAPPER_RULE,
+    LONG_SCRIPT_CHARS,
+    SENTENCE_WORKERS,
+)
 
 st.set_page_config(page_title="시각화 마스터", page_icon="📝", layout="centered")
 
 LOGIN_ID_ENV = os.getenv("LOGIN_ID")
 LOGIN_PW_ENV = os.getenv("LOGIN_PW")
-api_key = os.getenv("GPT_API_KEY")
-client = OpenAI(api_key=api_key)
+# 프로세스 전체가 공유하는 클라이언트 (재실행/세션마다 커넥션 풀을 새로 만들지 않음)
+client = get_client()
 
 CONFIG_PATH = "config.json"
+# 생성 기록 저장소에서 이 페이지의 기록을 구분하는 이름
+HISTORY_PAGE = "main01"
+# system_text 를 이루는 지침 섹션 (라벨, 세션 키) - 토큰 예산 표시에 사용
+INSTRUCTION_SECTIONS = [
+    ("1. 역할 지침", "inst_role"),
+    ("2. 톤 & 스타일 지침", "inst_tone"),
+    ("3. 콘텐츠 구성 지침", "inst_structure"),
+    ("4. 정보 밀도 & 조사 심도 지침", "inst_depth"),
+    ("5. 금지 지침", "inst_forbidden"),
+    ("6. 출력 형식 지침", "inst_format"),
+    ("7. 사용자 요청 반영 지침", "inst_user_intent"),
+    ("공통 스타일 래퍼", "inst_style_wrapper"),
+]
 
 st.markdown(
     """
@@ -150,16 +188,29 @@ st.session_state.setdefault(
 st.session_state.setdefault("current_input", "")
 st.session_state.setdefault("last_output", "")
 st.session_state.setdefault("model_choice", "gpt-4o-mini")
+st.session_state.setdefault("stream_mode", True)
+st.session_state.setdefault("bypass_cache", False)
+st.session_state.setdefault("auto_continue", True)
+st.session_state.setdefault("compact_wrapper", False)
+st.session_state.setdefault("generation_mode", "single")
+st.session_state.setdefault("last_metrics", {})
+st.session_state.setdefault("last_pairs", [])
+st.session_state.setdefault("generation_pending", False)
+st.session_state.setdefault("background_mode", True)
+st.session_state.setdefault("auto_route", False)
+st.session_state.setdefault("prompt_cache_order", False)
+st.session_state.setdefault("incremental_mode", True)
+st.session_state.setdefault("last_run", None)
+st.session_state.setdefault("use_translation_memory", True)
+st.session_state.setdefault("tm_threshold", TM_THRESHOLD)
+st.session_state.setdefault("jobs", [])
+st.session_state.setdefault("applied_jobs", [])
 
 
 def load_config():
-    if not os.path.exists(CONFIG_PATH):
-        return
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except JSONDecodeError:
-        return
+    data = get_config_store(CONFIG_PATH).load()
+    if not data:
+        return data
 
     if isinstance(data.get("inst_role"), str):
         st.session_state.inst_role = data["inst_role"]
@@ -180,7 +231,7 @@ def load_config():
 
     hist = data.get("history")
     if isinstance(hist, list):
-        st.session_state.history = hist[-5:]
+        st.session_state.history = [entry for entry in map(recent_entry, hist[-5:]) if entry]
 
     if isinstance(data.get("login_id"), str):
         st.session_state.login_id = data["login_id"]
@@ -189,9 +240,11 @@ def load_config():
     if "remember_login" in data:
         st.session_state.remember_login = bool(data["remember_login"])
 
+    return data
 
-def save_config():
-    data = {
+def config_data() -> dict:
+    # config.json 형식 그대로의 저장/내보내기 데이터
+    return {
         "inst_role": st.session_state.inst_role,
         "inst_tone": st.session_state.inst_tone,
         "inst_structure": st.session_state.inst_structure,
@@ -205,15 +258,18 @@ def save_config():
         "login_pw": st.session_state.login_pw,
         "remember_login": st.session_state.remember_login,
     }
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def save_config():
+    # 마지막으로 읽은/쓴 상태와 비교해 이 세션이 바꾼 행만 저장소에 반영
+    store = get_config_store(CONFIG_PATH)
+    st.session_state.config_rows = store.save(config_data(), st.session_state.get("config_rows"))
 
 
 # === config.json 및 세션 초기화 함수 ===
 def reset_config():
-    # 파일 삭제
-    if os.path.exists(CONFIG_PATH):
-        os.remove(CONFIG_PATH)
+    # 저장된 config 삭제
+    get_config_store(CONFIG_PATH).clear()
 
     # 세션 값 초기화 (지침/로그인/최근 기록)
     for key in [
@@ -231,6 +287,7 @@ def reset_config():
         "remember_login",
         "current_input",
         "last_output",
+        "config_rows",
     ]:
         if key in st.session_state:
             del st.session_state[key]
@@ -300,9 +357,14 @@ def login_screen():
                 st.error("❌ 아이디 또는 비밀번호가 틀렸습니다.")
 
 
-if "config_loaded" not in st.session_state:
-    load_config()
-    st.session_state.config_loaded = True
+def reload_config():
+    # 저장소에서 읽고, 저장소에 있던 키는 저장소 값 그대로를 이 세션의 기준 스냅샷으로 삼음
+    set_config_snapshot(load_config(), config_data())
+    # 읽으면서 바꾼 부분(이전 형식 변환)은 바로 저장소에 반영
+    save_config()
+
+
+init_shared_config(CONFIG_PATH, reload_config)
 
 if not st.session_state["logged_in"]:
     login_screen()
@@ -347,19 +409,9 @@ st.markdown(
 )
 
 
-def run_generation():
-    topic = st.session_state.current_input.strip()
-    if not topic:
-        return
-
-    hist = st.session_state.history
-    if topic in hist:
-        hist.remove(topic)
-    hist.append(topic)
-    st.session_state.history = hist[-5:]
-    save_config()
-
-    system_parts = [
+def build_generation_request(topic: str) -> dict:
+    # 백그라운드 작업 스레드는 st.session_state 를 읽을 수 없으므로, 실행에 필요한 값을 미리 스냅샷으로 만듦
+    stable_parts = [
         st.session_state.inst_role,
         st.session_state.inst_tone,
         st.session_state.inst_structure,
@@ -369,8 +421,14 @@ def run_generation():
         st.session_state.inst_user_intent,
         f"[공통 스타일 래퍼]\n{st.session_state.inst_style_wrapper}",
     ]
-    system_text = "\n\n".join(
-        part.strip() for part in system_parts if isinstance(part, str) and part.strip()
+    volatile_parts = []
+    wrapper = st.session_state.inst_style_wrapper.strip()
+    compact = st.session_state.compact_wrapper and bool(wrapper)
+    if compact:
+        # 압축 래퍼 모드: 모델은 래퍼 없이 묘사만 출력하고, 래퍼는 앱이 붙임
+        volatile_parts.append(COMPACT_WRAPPER_RULE)
+    system_text = compile_system_prompt(
+        stable_parts, volatile_parts, cache_order=st.session_state.prompt_cache_order
     )
 
     user_text = (
@@ -380,27 +438,135 @@ def run_generation():
         f"{topic}"
     )
 
+    mode = st.session_state.generation_mode
+    # 한 번의 응답으로는 긴 대본 출력이 오래 걸리고 잘리기 쉬우므로, 단일 호출이어도 긴 대본은 구간 병렬로 처리
+    if mode == "single" and len(topic) > LONG_SCRIPT_CHARS:
+        mode = "chunk"
+
+    # 대본의 문장 수/길이로 필요한 출력량을 추정해 max_tokens 와 모델을 정함
+    route = route_request(
+        st.session_state.model_choice,
+        plan_output_tokens(topic, wrapper, mode=mode, compact=compact),
+        prompt_tokens=count_tokens(system_text + user_text),
+        auto_model=st.session_state.auto_route,
+        parallelism=SENTENCE_WORKERS if mode in ("sentence", "chunk") else 1,
+    )
+
+    return {
+        "mode": mode,
+        "model": route["model"],
+        "system_text": system_text,
+        "user_text": user_text,
+        "script": topic,
+        "wrapper": wrapper,
+        "compact_wrapper": compact,
+        "stream": st.session_state.stream_mode,
+        "use_cache": not st.session_state.bypass_cache,
+        "auto_continue": st.session_state.auto_continue,
+        "max_tokens": route["max_tokens"],
+        "route": route,
+        "verify": True,
+        # 직전 실행과 비교해 바뀐 문장만 다시 생성
+        "previous": st.session_state.last_run if st.session_state.incremental_mode else None,
+        # 예전에 변환한 (비슷한) 문장은 번역 메모리에서 채움
+        "translation_memory": st.session_state.use_translation_memory,
+        "tm_threshold": st.session_state.tm_threshold,
+    }
+
+
+def apply_generation_result(result: dict):
+    st.session_state.last_output = result["text"]
+    st.session_state.last_metrics = result
+    # 문장 분할 / 긴 대본 / JSON 모드는 구조화된 쌍을 그대로 보관 (정규식으로 다시 긁지 않음)
+    st.session_state.last_pairs = result.get("pairs", [])
+    st.session_state.last_run = incremental_base(result)
+
+
+def record_history(req: dict, result: dict):
+    # 백그라운드 작업 스레드에서도 호출되므로 session_state 를 쓰지 않음
+    if result.get("text"):
+        get_history_store().append(HISTORY_PAGE, req["script"], result["text"], history_meta(result))
+
+
+def reopen_history(run_id: int):
+    # 버튼 콜백: 입력 위젯보다 먼저 실행되므로 입력창 내용도 바꿀 수 있음
+    run = get_history_store().get(run_id)
+    if run is None:
+        return
+    st.session_state.current_input = run["input"]
+    apply_generation_result(dict(run["meta"], text=run["output"], history_id=run_id))
+
+
+def push_recent(text: str):
+    # 최근 입력에는 내용 해시와 짧은 미리보기만 두고, 전문은 기록 저장소에 한 번만 저장
+    entry = {"hash": get_history_store().put_text(text), "preview": make_preview(text)}
+    hist = [h for h in st.session_state.history if h["hash"] != entry["hash"]]
+    hist.append(entry)
+    st.session_state.history = hist[-5:]
+    save_config()
+
+
+def load_recent(text_hash: str):
+    # 버튼 콜백: 누른 항목의 전문만 저장소에서 읽어 입력창에 넣음
+    text = get_history_store().get_text(text_hash)
+    if text is not None:
+        st.session_state.current_input = text
+
+
+def run_generation(placeholder=None):
+    topic = st.session_state.current_input.strip()
+    if not topic:
+        return
+
+    push_recent(topic)
+
+    req = build_generation_request(topic)
+    if st.session_state.background_mode:
+        # 백그라운드 실행: 스크립트 스레드는 바로 돌아가고, 진행 상황은 작업 패널이 주기적으로 갱신
+        submit_generation_job(client, req, record_history)
+        return
+
+    # 스트리밍 모드: 토큰이 도착하는 대로 결과 영역(placeholder)에 바로 그림
+    on_delta = placeholder.markdown if (placeholder is not None and st.session_state.stream_mode) else None
+    on_pairs = None
+    if on_delta:
+        # JSON 스키마 모드: 완성된 문장 쌍을 도착하는 대로 표로 보여줌
+        def on_pairs(pairs):
+            placeholder.dataframe(pairs, use_container_width=True)
+
     with st.spinner("🎬 대본을 시각화용 프롬프트로 변환하는 중입니다..."):
-        res = client.chat.completions.create(
-            model=st.session_state.model_choice,
-            messages=[
-                {"role": "system", "content": system_text},
-                {"role": "user", "content": user_text},
-            ],
-            max_tokens=800,
-        )
+        result = execute_request(client, req, on_delta=on_delta, on_pairs=on_pairs)
+    record_history(req, result)
+    apply_generation_result(result)
 
-    st.session_state.last_output = res.choices[0].message.content
+
+def request_generation():
+    if st.session_state.background_mode:
+        # 작업 제출만 하므로 콜백 안에서 바로 처리
+        run_generation()
+        return
+    # on_change 콜백 안에서는 결과 영역에 그릴 수 없으므로, 실행은 결과 영역에서 처리
+    st.session_state.generation_pending = True
 
 
 # -------- 사이드바 --------
 with st.sidebar:
     st.markdown("<div class='sidebar-top'>", unsafe_allow_html=True)
+    render_config_watch(CONFIG_PATH)
 
     st.markdown("### 📘 지침")
+    prompt_budget = section_budget(
+        [(label, st.session_state.get(key, "")) for label, key in INSTRUCTION_SECTIONS]
+    )
+    largest = max(prompt_budget["sections"], key=lambda row: row["tokens"])
+    st.caption(
+        f"📏 시스템 프롬프트 약 {prompt_budget['total']} 토큰 · 매 호출마다 전송 · "
+        f"가장 큰 섹션: {largest['label']} ({largest['share'] * 100:.0f}%)"
+    )
 
     with st.expander("1. 역할 지침 (Role Instructions)", expanded=False):
         st.caption("한국어 대본을 이미지 시각화용 영어 프롬프트로 변환하는 역할을 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_role)} 토큰")
         inst_role_edit = st.text_area(
             "역할 지침",
             st.session_state.inst_role,
@@ -415,6 +581,7 @@ with st.sidebar:
 
     with st.expander("2. 톤 & 스타일 지침 + 공통 스타일 래퍼", expanded=False):
         st.caption("전체적인 톤/스타일 규칙과, 모든 이미지 프롬프트 앞에 붙일 공통 스타일 래퍼를 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_tone) + count_tokens(st.session_state.inst_style_wrapper)} 토큰")
 
         inst_tone_edit = st.text_area(
             "톤 & 스타일 지침",
@@ -441,6 +608,7 @@ with st.sidebar:
 
     with st.expander("3. 콘텐츠 구성 지침", expanded=False):
         st.caption("스크립트-투-이미지 출력의 전체 흐름 구조를 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_structure)} 토큰")
         inst_structure_edit = st.text_area(
             "콘텐츠 구성 지침",
             st.session_state.inst_structure,
@@ -455,6 +623,7 @@ with st.sidebar:
 
     with st.expander("4. 정보 밀도 & 조사 심도 지침", expanded=False):
         st.caption("얼마나 구체적이고 깊게 시각 정보를 확장할지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_depth)} 토큰")
         inst_depth_edit = st.text_area(
             "정보 밀도 & 조사 심도 지침",
             st.session_state.inst_depth,
@@ -469,6 +638,7 @@ with st.sidebar:
 
     with st.expander("5. 금지 지침 (Forbidden Rules)", expanded=False):
         st.caption("절대 허용하지 않을 변형/스타일/출력 형식을 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_forbidden)} 토큰")
         inst_forbidden_edit = st.text_area(
             "금지 지침",
             st.session_state.inst_forbidden,
@@ -483,6 +653,7 @@ with st.sidebar:
 
     with st.expander("6. 출력 형식 지침 (Format Rules)", expanded=False):
         st.caption("최종 출력의 제목, 블록 구조, 줄 배치 등을 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_format)} 토큰")
         inst_format_edit = st.text_area(
             "출력 형식 지침",
             st.session_state.inst_format,
@@ -497,6 +668,7 @@ with st.sidebar:
 
     with st.expander("7. 사용자 요청 반영 지침", expanded=False):
         st.caption("사용자 요구(장르/스타일/시각화 정도 등)를 어떻게 반영할지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_user_intent)} 토큰")
         inst_user_intent_edit = st.text_area(
             "사용자 요청 반영 지침",
             st.session_state.inst_user_intent,
@@ -523,6 +695,75 @@ with st.sidebar:
             label_visibility="collapsed",
         )
         st.session_state.model_choice = model
+        st.checkbox(
+            "대본 길이에 맞춰 모델 자동 선택 (가장 저렴한 모델)",
+            key="auto_route",
+            help="켜면 위에서 고른 모델 대신 출력량/지연 예산에 맞는 가장 싼 모델을 씁니다. 바뀐 경우 결과 지표에 표시됩니다.",
+        )
+        st.checkbox(
+            "스트리밍 출력 (토큰 단위로 바로 표시)",
+            key="stream_mode",
+        )
+        st.radio(
+            "생성 방식",
+            ["single", "sentence", "chunk", "json"],
+            format_func=lambda m: {
+                "single": "단일 호출",
+                "sentence": "문장 분할 (병렬)",
+                "chunk": "긴 대본 (구간 병렬)",
+                "json": "구조화 JSON",
+            }[m],
+            key="generation_mode",
+            horizontal=True,
+        )
+        st.checkbox(
+            "잘린 응답 자동 이어쓰기",
+            key="auto_continue",
+        )
+        st.checkbox(
+            "백그라운드 실행 (생성 중에도 편집 가능)",
+            key="background_mode",
+        )
+        st.checkbox(
+            "래퍼 압축 모드 (스타일 래퍼는 앱이 붙임)",
+            key="compact_wrapper",
+        )
+        st.checkbox(
+            "(실험) 고정 지침을 긴 것부터 정렬",
+            key="prompt_cache_order",
+            help="기본은 작성한 지침 순서 그대로 두고 자주 바뀌는 부분만 맨 뒤에 붙입니다. 캐시 적중률을 비교해 볼 때만 켜세요.",
+        )
+        st.checkbox(
+            "바뀐 문장만 다시 생성",
+            key="incremental_mode",
+            help="직전 결과와 같은 지침이면 대본에서 고치거나 추가한 문장만 모델에 보내고, 나머지는 직전 결과를 재사용합니다.",
+        )
+        st.checkbox(
+            "번역 메모리 사용",
+            key="use_translation_memory",
+            help="예전에 같은 지침으로 변환한 문장(오프닝, 반복 내레이션, 협찬 문구 등)은 모델에 보내지 않고 저장된 프롬프트를 씁니다. "
+                 "문장별/긴 대본 모드에서 적용되고, 단일 호출 결과도 메모리에 쌓입니다.",
+        )
+        st.slider(
+            "번역 메모리 유사도 기준",
+            min_value=0.7,
+            max_value=1.0,
+            step=0.01,
+            key="tm_threshold",
+            disabled=not st.session_state.use_translation_memory,
+            help="1.0 이면 (공백/문장부호를 무시하고) 완전히 같은 문장만, 낮출수록 조금 다른 문장도 메모리에서 채웁니다.",
+        )
+        tm_stats = get_translation_memory().stats()
+        counters = get_metrics()
+        st.caption(
+            f"번역 메모리: {tm_stats['entries']}문장 · "
+            f"이번 세션 적중 {counters.get('tm.hits', 0)}/{counters.get('tm.lookups', 0)}문장"
+        )
+        st.checkbox(
+            "응답 캐시 우회 (항상 새로 생성)",
+            key="bypass_cache",
+        )
+        render_service_stats()
 
     with st.expander("👤 계정 관리", expanded=False):
         st.caption("비밀번호 변경 및 로그아웃")
@@ -550,6 +791,7 @@ with st.sidebar:
             st.session_state.logged_in = False
             st.session_state.current_input = ""
             st.session_state.last_output = ""
+            st.session_state.last_pairs = []
             st.rerun()
 
     # === config.json 초기화 섹션 ===
@@ -579,32 +821,29 @@ st.markdown(
 
 # -------- div2: 최근 입력 --------
 if st.session_state.history:
-    items = st.session_state.history[-5:]
-
-    html_items = ""
-    for h in items:
-        html_items += f"""
-<div style="
-    font-size:0.85rem;
-    color:#797979;
-    margin-bottom:4px;
-">{h}</div>
-"""
-
+    # 미리보기만 그리고(재실행마다 전문을 보내지 않음), 누른 항목의 전문만 저장소에서 불러옴
     st.markdown(
-        f"""<div style="
+        """<div style="
     max-width:460px;
-    margin:64px auto 72px auto;
+    margin:64px auto 10px auto;
 ">
-  <div style="margin-left:100px; text-align:left;">
-    <div style="font-size:0.8rem; color:#9ca3af; margin-bottom:10px;">
-      최근
-    </div>
-    {html_items}
+  <div style="margin-left:100px; font-size:0.8rem; color:#9ca3af; text-align:left;">
+    최근
   </div>
 </div>""",
         unsafe_allow_html=True,
     )
+    pad_left, recent_col, pad_right = st.columns([2, 5, 2])
+    with recent_col:
+        for entry in st.session_state.history[-5:]:
+            st.button(
+                entry["preview"] or "(빈 입력)",
+                key=f"recent_{entry['hash']}",
+                on_click=load_recent,
+                args=(entry["hash"],),
+                use_container_width=True,
+            )
+    st.markdown("<div style='height:72px;'></div>", unsafe_allow_html=True)
 else:
     st.markdown(
         """<div style="
@@ -618,6 +857,31 @@ else:
         unsafe_allow_html=True,
     )
 
+# ----- 생성 기록 검색 (입력/출력 전문 검색 → API 호출 없이 다시 열기) -----
+with st.expander("🔎 생성 기록 검색", expanded=False):
+    history_query = st.text_input(
+        "기록 검색",
+        key="history_query",
+        placeholder="입력이나 결과에 들어 있는 말로 검색",
+        label_visibility="collapsed",
+    )
+    runs = get_history_store().search(history_query, page=HISTORY_PAGE)
+    if not runs:
+        st.caption("저장된 기록이 없습니다." if not history_query.strip() else "검색 결과가 없습니다.")
+    for run in runs:
+        col_text, col_open = st.columns([5, 1])
+        with col_text:
+            created = time.strftime("%m-%d %H:%M", time.localtime(run["created"]))
+            st.caption(f"{created} · {run['model'] or '-'} · {run['preview']}")
+        with col_open:
+            st.button(
+                "열기",
+                key=f"history_open_{run['id']}",
+                on_click=reopen_history,
+                args=(run["id"],),
+                use_container_width=True,
+            )
+
 # -------- div3: 입력 영역 (가운데 정렬, 버튼 없이 on_change) --------
 pad_left, center_col, pad_right = st.columns([1, 7, 1])
 
@@ -632,12 +896,52 @@ with center_col:
         key="current_input",
         placeholder="gpt에게 시각화 부탁하기",
         label_visibility="collapsed",
-        on_change=run_generation,
+        on_change=request_generation,
     )
 
 st.markdown("<div style='height:32px;'></div>", unsafe_allow_html=True)
 
+# -------- 진행 중인 작업 --------
+render_job_panel(apply_generation_result)
+
 # -------- 결과 --------
+if st.session_state.generation_pending:
+    st.session_state.generation_pending = False
+    st.subheader("📄 생성된 스크립트-투-이미지 프롬프트")
+    run_generation(st.empty())
+    st.rerun()
+
 if st.session_state.last_output:
     st.subheader("📄 생성된 스크립트-투-이미지 프롬프트")
     st.write(st.session_state.last_output)
+    if st.session_state.last_metrics:
+        st.caption(format_metrics(st.session_state.last_metrics))
+        for issue in st.session_state.last_metrics.get("format_issues", []):
+            st.warning(f"형식 검증: {issue}")
+
+    # 구조화된 문장 쌍: 표로 보여주고 JSON / CSV 로 바로 내보내기
+    if st.session_state.last_pairs:
+        with st.expander(f"📋 문장별 표 ({len(st.session_state.last_pairs)}쌍)", expanded=False):
+            st.dataframe(st.session_state.last_pairs, use_container_width=True)
+            export_doc = {
+                "analysis": st.session_state.last_metrics.get("analysis", ""),
+                "style_wrapper": st.session_state.last_metrics.get("wrapper", ""),
+                "pairs": st.session_state.last_pairs,
+            }
+            col_json, col_csv = st.columns(2)
+            with col_json:
+                st.download_button(
+                    "⬇️ JSON 내보내기",
+                    data=json.dumps(export_doc, ensure_ascii=False, indent=2).encode("utf-8"),
+                    file_name="visual_prompts.json",
+                    mime="application/json",
+                    use_container_width=True,
+                )
+            with col_csv:
+                st.download_button(
+                    "⬇️ CSV 내보내기",
+                    data=pairs_to_csv(st.session_state.last_pairs).encode("utf-8-sig"),
+                    file_name="visual_prompts.csv",
+                    mime="text/csv",
+                    use_container_width=True,
+                )
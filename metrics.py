@@ -0,0 +1,16 @@
+import threading
+from collections import defaultdict
+
+# 프로세스 전체(모든 세션 공용) 카운터. 사이드바 등에서 스냅샷으로 읽음
+_counters = defaultdict(int)
+_lock = threading.Lock()
+
+
+def incr(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def get_metrics() -> dict:
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,54 @@
+import os
+import threading
+
+import httpx
+import streamlit as st
+from openai import OpenAI
+
+# 모든 세션/재실행이 공유하는 프로세스 단일 OpenAI 클라이언트 (keep-alive 커넥션 풀 재사용)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "0") == "1"
+
+
+def _http2_available() -> bool:
+    # httpx 의 HTTP/2 는 h2 패키지가 있어야 동작
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def warm_up(client):
+    # 첫 요청 전에 TLS 핸드셰이크를 끝내 커넥션을 풀에 넣어둠 (실패해도 무시)
+    try:
+        client.with_options(timeout=10, max_retries=0).models.list()
+    except Exception:
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_client() -> OpenAI:
+    timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    http_client = httpx.Client(
+        http2=OPENAI_HTTP2 and _http2_available(),
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=timeout,
+    )
+    # 재시도/백오프는 resilience.call_resilient 가 담당하므로 SDK 자체 재시도는 끔 (중복 재시도 방지)
+    client = OpenAI(
+        api_key=os.getenv("GPT_API_KEY"),
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=0,
+    )
+    threading.Thread(target=warm_up, args=(client,), daemon=True).start()
+    return client
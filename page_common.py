@@ -0,0 +1,192 @@
+import streamlit as st
+
+from config_store import get_config_store, config_rows, changed_rows, is_history_row, HISTORY_KEY
+from history_store import recent_entry
+from jobs import submit_job, get_job
+from metrics import get_metrics
+from resilience import get_latency_tracker, get_circuit_breaker
+from response_cache import get_response_cache
+from visual_pipeline import execute_request
+
+# 여러 페이지(main01 / visual_page / main03)가 똑같이 쓰는 화면 조각:
+# 세션 간 config 동기화, 백그라운드 작업 패널, 사이드바 지표
+
+# 다른 세션의 config 변경을 확인하는 주기(초)
+CONFIG_POLL_SECONDS = 5
+# 백그라운드 작업 패널 갱신 주기(초)
+JOB_POLL_SECONDS = 0.5
+
+
+def set_config_snapshot(data: dict, current: dict):
+    # 저장소에 있던 키는 저장소 값 그대로를 이 세션의 기준 스냅샷으로 삼음
+    # current: 페이지의 config_data() (읽은 직후 세션 상태)
+    current.update({key: data[key] for key in current if key in data})
+    st.session_state.config_rows = config_rows(current)
+
+
+def _adopt_recent(data: dict):
+    # 다른 세션이 최근 입력만 바꾼 경우: 알림 없이 최근 입력 목록과 그 스냅샷 행만 저장소 것으로 맞춤
+    hist = data.get(HISTORY_KEY)
+    if not isinstance(hist, list) or "history" not in st.session_state:
+        return
+    entries = [entry for entry in map(recent_entry, hist[-5:]) if entry]
+    snapshot = st.session_state.get("config_rows", {})
+    rows = {key: value for key, value in snapshot.items() if not is_history_row(key)}
+    rows.update(config_rows({HISTORY_KEY: entries}))
+    st.session_state.history = entries
+    st.session_state.config_rows = rows
+
+
+def config_changed_elsewhere(config_path: str) -> bool:
+    # 저장소 버전이 바뀌었고, 그 설정 행이 이 세션이 마지막으로 읽은/쓴 것과 다르면 다른 세션(또는 손으로 고친 파일)의 변경
+    store = get_config_store(config_path)
+    version = store.version()
+    if st.session_state.get("config_version") == version:
+        return False
+    data = store.load()
+    if changed_rows(data, st.session_state.get("config_rows", {})):
+        return True
+    # 이 세션이 저장해서 올라간 버전이거나, 다른 세션이 최근 입력만 추가한 버전
+    _adopt_recent(data)
+    st.session_state.config_version = version
+    return False
+
+
+def sync_shared_config(config_path: str, reload_config, on_reload=None):
+    # 재실행 시작 시점(위젯을 그리기 전)에 다른 곳의 변경을 반영
+    if not config_changed_elsewhere(config_path):
+        return
+    st.session_state.config_version = get_config_store(config_path).version()
+    reload_config()
+    if on_reload:
+        on_reload()
+    st.toast("🔄 다른 세션에서 바뀐 지침/설정을 불러왔습니다.")
+
+
+@st.fragment(run_every=CONFIG_POLL_SECONDS)
+def render_config_watch(config_path: str):
+    # 가만히 있는 세션에도 알림만 띄움 (입력 중인 내용이 날아가지 않게 자동으로 다시 그리지는 않음)
+    if config_changed_elsewhere(config_path):
+        st.info("🔄 다른 세션에서 지침/설정이 바뀌었습니다.")
+        if st.button("최신 설정 불러오기", key="config_reload", use_container_width=True):
+            st.rerun()
+
+
+def init_shared_config(config_path: str, reload_config, on_reload=None):
+    # 페이지 시작 시 한 번: 새 세션은 읽어 오고, 이어지는 재실행에서는 다른 곳의 변경만 반영
+    # reload_config(): 페이지별로 저장소를 읽어 세션에 넣고 스냅샷을 잡음 / on_reload(): 다시 읽은 뒤 후처리
+    if "config_loaded" not in st.session_state:
+        # 새 세션은 프로세스가 공유하는 파싱 결과를 받으므로 파일을 다시 읽지 않음
+        st.session_state.config_version = get_config_store(config_path).version()
+        reload_config()
+        st.session_state.config_loaded = True
+    else:
+        sync_shared_config(config_path, reload_config, on_reload)
+
+
+def submit_generation_job(client, req: dict, record_history):
+    # record_history(req, result): 페이지별 기록 저장 (워커 스레드에서 실행되므로 st.* 를 쓰면 안 됨)
+    def work(job):
+        def on_pairs(pairs):
+            job.set_partial("\n\n".join(f"{p['ko']}\n{p['en']}" for p in pairs))
+
+        result = execute_request(
+            client,
+            req,
+            on_delta=job.set_partial,
+            on_pairs=on_pairs,
+            on_progress=job.set_progress,
+        )
+        record_history(req, result)
+        return result
+
+    job = submit_job(req["script"][:30], work)
+    st.session_state.jobs.append(job.id)
+
+
+def render_job_panel(apply_generation_result):
+    if not st.session_state.jobs:
+        return
+    jobs_now = [get_job(job_id) for job_id in st.session_state.jobs]
+    active = any(job is not None and job.active for job in jobs_now)
+
+    # 진행 중인 작업이 있을 때만 주기적으로 이 영역만 다시 그림 (페이지 전체 재실행 없음)
+    @st.fragment(run_every=JOB_POLL_SECONDS if active else None)
+    def job_panel():
+        finished_now = []
+        for job_id in list(st.session_state.jobs):
+            job = get_job(job_id)
+            if job is None:
+                st.session_state.jobs.remove(job_id)
+                continue
+            icon = {"queued": "⏳", "running": "🔄", "done": "✅", "error": "❌"}[job.state]
+            st.caption(f"{icon} {job.label} · {job.elapsed:.1f}초")
+            if job.active:
+                if job.progress is not None:
+                    st.progress(job.progress)
+                if job.partial:
+                    st.text(job.partial[-1500:])
+                continue
+            if job.state == "error":
+                st.error(f"생성 실패: {job.error}")
+            elif job_id not in st.session_state.applied_jobs:
+                finished_now.append(job)
+            col_open, col_close = st.columns(2)
+            with col_open:
+                if job.state == "done" and st.button("결과 보기", key=f"job_open_{job_id}", use_container_width=True):
+                    apply_generation_result(job.result)
+                    st.rerun()
+            with col_close:
+                if st.button("닫기", key=f"job_close_{job_id}", use_container_width=True):
+                    st.session_state.jobs.remove(job_id)
+                    st.rerun(scope="fragment")
+
+        # 새로 끝난 작업은 한 번만 결과 영역에 자동 반영
+        if finished_now:
+            for job in finished_now:
+                st.session_state.applied_jobs.append(job.id)
+            apply_generation_result(finished_now[-1].result)
+            st.rerun()
+
+    job_panel()
+
+
+def render_service_stats():
+    # 모델 설정 expander 하단: 응답 캐시 / 호출 병합 / 한도 대기 / 재시도·헤지 / 프롬프트 캐시 / 모델 상태
+    counters = get_metrics()
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"응답 캐시: {cache_stats['entries']}건 · {cache_stats['bytes'] / 1024:.0f} KB"
+    )
+    st.caption(
+        f"동일 요청 병합: {counters.get('singleflight.shared', 0)}건 · "
+        f"업스트림 호출 {counters.get('singleflight.calls', 0)}회"
+    )
+    st.caption(
+        f"한도 대기: {counters.get('ratelimit.queued', 0)}건 · "
+        f"429 재대기 {counters.get('ratelimit.429', 0)}건"
+    )
+    p95 = get_latency_tracker().quantile(st.session_state.model_choice, 0.95)
+    st.caption(
+        f"재시도 {counters.get('resilience.retries', 0)}건 · "
+        f"헤지 {counters.get('resilience.hedges', 0)}건"
+        + (f" · p95 {p95:.1f}s" if p95 is not None else "")
+    )
+    st.caption(f"대체 모델 응답: {counters.get('resilience.fallbacks', 0)}건")
+    prompt_tokens = counters.get("prompt.tokens", 0)
+    if prompt_tokens:
+        cached_calls = counters.get("prompt.cached_calls", 0)
+        uncached_calls = counters.get("prompt.uncached_calls", 0)
+        ttft_cached = counters.get("prompt.cached_ttft_ms", 0) / max(1, cached_calls) / 1000
+        ttft_uncached = counters.get("prompt.uncached_ttft_ms", 0) / max(1, uncached_calls) / 1000
+        st.caption(
+            f"프롬프트 캐시 적중률: {counters.get('prompt.cached_tokens', 0) / prompt_tokens * 100:.0f}% · "
+            f"첫 토큰 평균 적중 {ttft_cached:.2f}s / 미적중 {ttft_uncached:.2f}s"
+        )
+    for name, health in get_circuit_breaker().snapshot().items():
+        icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[health["state"]]
+        latency = f" · {health['latency']:.1f}s" if health["latency"] is not None else ""
+        st.caption(f"{icon} {name} · 오류율 {health['error_rate'] * 100:.0f}%{latency}")
+    if st.button("응답 캐시 비우기", key="clear_response_cache", use_container_width=True):
+        get_response_cache().clear()
+        st.rerun()
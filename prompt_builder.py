@@ -0,0 +1,94 @@
+import hashlib
+import json
+
+from token_count import count_tokens
+
+# system_text 조립: OpenAI 프롬프트 캐시는 "앞부분이 바이트 단위로 같은" 요청끼리만 적중하므로
+# 고정 지침은 작성한 순서 그대로 앞에, 자주 바뀌는 부분(공통 이미지 지침, 모드별 규칙)은 맨 뒤에 둠
+
+
+def normalize_part(text: str) -> str:
+    # 줄바꿈/끝 공백 차이로 접두부가 달라지지 않도록 정규화
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def _clean(parts) -> list:
+    return [normalize_part(p) for p in parts if isinstance(p, str) and p.strip()]
+
+
+def compile_system_prompt(stable: list, volatile: list = (), cache_order: bool = False) -> str:
+    # 기본: 안정 섹션은 작성한 순서(역할 지침이 맨 앞), 가변 섹션은 항상 마지막
+    # cache_order=True(실험, 기본 꺼짐): 안정 섹션을 긴 것부터 정렬. 섹션 길이가 바뀌면 순서 전체가 바뀌어
+    # 접두부가 깨질 수 있으므로 적중률을 재 보기 전까지는 켜지 않음
+    stable_parts = _clean(stable)
+    if cache_order:
+        stable_parts = sorted(stable_parts, key=lambda p: (-len(p), p))
+    return "\n\n".join(stable_parts + _clean(volatile))
+
+
+def prompt_cache_key(system_text: str) -> str:
+    # 같은 system_text 요청이 같은 캐시 서버로 가도록 하는 라우팅 힌트
+    return hashlib.sha256(system_text.encode("utf-8")).hexdigest()[:32]
+
+
+# 지침 set 하나를 이루는 텍스트 지침 필드 (system_text 에 들어가는 순서)
+INSTRUCTION_KEYS = [
+    "inst_role",
+    "inst_tone",
+    "inst_structure",
+    "inst_depth",
+    "inst_forbidden",
+    "inst_format",
+    "inst_user_intent",
+]
+
+
+def instruction_hash(set_obj: dict) -> str:
+    # 지침 내용(필드 값)만으로 정해지는 버전 키 - 조립 순서 설정과 무관
+    raw = json.dumps([set_obj.get(key, "") for key in INSTRUCTION_KEYS], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_instruction_set(set_obj: dict, cache_order: bool = False) -> dict:
+    # 지침 set 을 저장할 때 한 번 조립해 set 에 붙여둠 → 생성 시에는 다시 조립하지 않고 그대로 사용
+    system_text = compile_system_prompt(
+        [set_obj.get(key, "") for key in INSTRUCTION_KEYS], cache_order=cache_order
+    )
+    compiled = {
+        "system_text": system_text,
+        "hash": instruction_hash(set_obj),
+        "tokens": count_tokens(system_text),
+        "cache_order": cache_order,
+    }
+    set_obj["compiled"] = compiled
+    return compiled
+
+
+def get_compiled(set_obj: dict, cache_order: bool = False) -> dict:
+    # 컴파일 결과가 없거나(이전 버전 config) 조립 순서 설정이 바뀌었을 때만 다시 만듦
+    compiled = set_obj.get("compiled")
+    if not isinstance(compiled, dict) or compiled.get("cache_order") != cache_order:
+        compiled = compile_instruction_set(set_obj, cache_order)
+    return compiled
+
+
+def refresh_compiled(sets: list, cache_order: bool = False) -> bool:
+    # config 를 읽은 직후 한 번: 손으로 고친 config 처럼 내용과 해시가 어긋난 set,
+    # 다른 조립 순서로 컴파일해 둔 set(예: 예전 기본값이던 길이순 정렬)을 다시 컴파일
+    changed = False
+    for set_obj in sets:
+        compiled = set_obj.get("compiled")
+        if (
+            not isinstance(compiled, dict)
+            or compiled.get("hash") != instruction_hash(set_obj)
+            or compiled.get("cache_order") != cache_order
+        ):
+            compile_instruction_set(set_obj, cache_order)
+            changed = True
+    return changed
+
+
+def append_volatile(system_text: str, volatile: list) -> str:
+    # 컴파일된 고정 접두부 뒤에 가변 섹션을 붙임
+    return "\n\n".join(([system_text] if system_text else []) + _clean(volatile))
@@ -0,0 +1,198 @@
+import json
+import os
+import re
+import threading
+import time
+
+from metrics import incr
+from token_count import count_message_tokens
+
+# 모델별 RPM / TPM 토큰 버킷으로 요청을 받아들이고, 한도를 넘는 요청은 실패시키지 않고 대기열에서 기다리게 함
+# 기본값은 OpenAI tier-1 한도. OPENAI_RATE_LIMITS='{"gpt-4o": [500, 30000]}' 처럼 모델별로 덮어쓸 수 있음
+DEFAULT_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o": (500, 30_000),
+    "gpt-4.1": (500, 30_000),
+}
+FALLBACK_LIMITS = (500, 30_000)
+# 429 를 받았을 때 같은 요청을 다시 대기열에 넣는 최대 횟수
+RATE_LIMIT_RETRIES = 3
+# 429 응답에 재시도 시각이 없을 때 모델 전체를 멈추는 시간(초)
+DEFAULT_PAUSE_SECONDS = 2.0
+
+_RETRY_AFTER_RE = re.compile(r"try again in ([\d.]+)(ms|s)")
+
+
+def estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    # TPM 한도는 입력 토큰 + max_tokens 로 계산되므로 둘을 합쳐서 예약
+    return count_message_tokens(messages) + int(max_tokens)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm, rpm)
+        self.tokens = TokenBucket(tpm, tpm)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        # 대기 순서를 지키기 위한 번호표 (앞 요청이 자리를 얻을 때까지 뒤 요청은 기다림)
+        # threading.Lock 은 기다리는 순서대로 깨워 준다는 보장이 없어서 번호표로 도착 순서를 지킴
+        self.admit = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+
+class RateLimiter:
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> _ModelLimiter:
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                rpm, tpm = self.limits.get(model, FALLBACK_LIMITS)
+                limiter = _ModelLimiter(rpm, tpm)
+                self._models[model] = limiter
+            return limiter
+
+    def acquire(self, model: str, tokens: int) -> float:
+        # 자리가 날 때까지 기다렸다가 요청 1개 + tokens 를 예약. 기다린 시간(초)을 돌려줌
+        limiter = self._get(model)
+        started = time.monotonic()
+        with limiter.admit:
+            ticket = limiter.next_ticket
+            limiter.next_ticket += 1
+            while limiter.serving != ticket:
+                limiter.admit.wait()
+        try:
+            while True:
+                with limiter.lock:
+                    now = time.monotonic()
+                    wait = max(
+                        limiter.paused_until - now,
+                        limiter.requests.wait_time(1, now),
+                        limiter.tokens.wait_time(tokens, now),
+                    )
+                    if wait <= 0:
+                        limiter.requests.take(1)
+                        limiter.tokens.take(tokens)
+                        break
+                time.sleep(min(wait, 1.0))
+        finally:
+            with limiter.admit:
+                limiter.serving += 1
+                limiter.admit.notify_all()
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            incr("ratelimit.queued")
+            incr("ratelimit.wait_ms", int(waited * 1000))
+        return waited
+
+    def settle(self, model: str, reserved: int, used: int):
+        # 실제 사용량이 예약보다 적으면 돌려주고, 많으면 더 차감
+        if not used:
+            return
+        limiter = self._get(model)
+        with limiter.lock:
+            if used < reserved:
+                limiter.tokens.give(reserved - used)
+            else:
+                limiter.tokens.take(used - reserved)
+
+    def pause(self, model: str, seconds: float):
+        limiter = self._get(model)
+        with limiter.lock:
+            limiter.paused_until = max(limiter.paused_until, time.monotonic() + seconds)
+
+
+def _load_limits() -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    raw = os.getenv("OPENAI_RATE_LIMITS")
+    if raw:
+        try:
+            for model, (rpm, tpm) in json.loads(raw).items():
+                limits[model] = (int(rpm), int(tpm))
+        except (ValueError, TypeError):
+            pass
+    return limits
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429
+
+
+def retry_after_seconds(exc: Exception) -> float:
+    # Retry-After 헤더 → 에러 메시지("Please try again in 1.2s") 순서로 확인
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                seconds = float(value)
+            except ValueError:
+                continue
+            return seconds / 1000 if name.endswith("-ms") else seconds
+    m = _RETRY_AFTER_RE.search(str(exc))
+    if m:
+        value = float(m.group(1))
+        return value / 1000 if m.group(2) == "ms" else value
+    return DEFAULT_PAUSE_SECONDS
+
+
+def run_scheduled(model: str, estimated: int, fn) -> dict:
+    # fn() 은 usage 를 담은 결과 dict 를 돌려주는 실제 API 호출
+    # 429 를 받으면 해당 모델을 잠시 멈추고 같은 요청을 다시 대기열에 넣음
+    limiter = get_rate_limiter()
+    queued = 0.0
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        queued += limiter.acquire(model, estimated)
+        try:
+            result = fn()
+        except Exception as exc:
+            if not is_rate_limited(exc) or attempt == RATE_LIMIT_RETRIES:
+                raise
+            incr("ratelimit.429")
+            limiter.pause(model, retry_after_seconds(exc))
+            continue
+        limiter.settle(model, estimated, (result.get("usage") or {}).get("total_tokens", 0))
+        result["queued"] = queued
+        return result
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(_load_limits())
+        return _limiter
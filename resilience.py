@@ -0,0 +1,287 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import incr
+from rate_limit import is_rate_limited
+from router import MODEL_PROFILES
+
+# 호출 1회(attempt)마다 마감 시간을 두고, 일시적 오류(5xx/타임아웃/연결 끊김)는 지터를 준 지수 백오프로 재시도
+# 429 는 rate_limit.run_scheduled 가 모델을 멈추고 다시 대기열에 넣어 처리하므로 여기서는 재시도하지 않음
+# 비스트리밍 호출은 선택적으로 헤지(hedge): 최근 p95 지연을 넘기면 같은 요청을 하나 더 보내 먼저 끝난 쪽을 씀
+# 시도별 마감 시간의 하한(초). 출력이 긴 요청은 max_tokens 를 모델의 출력 속도로 다 쓰는 시간에 여유를 더해 늘림
+ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_ATTEMPT_TIMEOUT", "60"))
+ATTEMPT_TIMEOUT_MARGIN = 1.5
+# 출력 속도를 모르는 모델에 가정하는 토큰/초
+DEFAULT_TOKENS_PER_SEC = 40
+MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+HEDGE_ENABLED = os.getenv("OPENAI_HEDGE", "0") == "1"
+HEDGE_QUANTILE = 0.95
+# 지연 표본이 이만큼 쌓이기 전에는 헤지하지 않음 (p95 추정이 불안정)
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5
+HEDGE_WORKERS = int(os.getenv("OPENAI_HEDGE_WORKERS", "32"))
+# 모델별로 기억하는 최근 지연 표본 수
+LATENCY_WINDOW = 200
+
+# 선택한 모델이 회로 차단(open) 상태거나 계속 실패하면 이 순서대로 다음 모델로 넘어감
+FALLBACK_ORDER = [
+    m.strip() for m in os.getenv("OPENAI_FALLBACK_ORDER", "gpt-4o-mini,gpt-4o,gpt-4.1").split(",") if m.strip()
+]
+# 모델 상태(오류율/지연) 지수이동평균 가중치
+EWMA_ALPHA = 0.2
+# 표본이 이만큼 쌓인 뒤 오류율 EWMA 나 지연 EWMA 가 기준을 넘으면 회로를 엶
+BREAKER_MIN_SAMPLES = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_LATENCY_SECONDS = float(os.getenv("OPENAI_BREAKER_LATENCY", "30"))
+# 회로를 연 뒤 시험 요청 1건(half-open)을 허용하기까지의 시간(초)
+BREAKER_COOLDOWN_SECONDS = 30.0
+
+_RETRYABLE_ERRORS = ("APITimeoutError", "APIConnectionError", "Timeout", "ConnectError", "ReadTimeout")
+
+
+class LatencyTracker:
+    def __init__(self, window: int):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, model: str, q: float, min_samples: int = 1):
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return len(self._samples.get(model, ()))
+
+
+class ModelHealth:
+    def __init__(self):
+        self.error_rate = 0.0
+        self.latency = None
+        self.samples = 0
+        self.state = "closed"  # closed / open / half_open
+        self.opened_at = 0.0
+        self.probing = False
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = ModelHealth()
+            self._models[model] = health
+        return health
+
+    def allow(self, model: str) -> bool:
+        with self._lock:
+            health = self._get(model)
+            if health.state == "closed":
+                return True
+            if health.state == "open":
+                if time.monotonic() - health.opened_at < BREAKER_COOLDOWN_SECONDS:
+                    return False
+                health.state = "half_open"
+                health.probing = False
+            # half-open: 시험 요청은 한 번에 하나만
+            if health.probing:
+                return False
+            health.probing = True
+            return True
+
+    def release(self, model: str):
+        # 시험 요청이 성공/실패로 기록되지 않고 끝난 경우(429 등) 판정 없이 다음 시험 요청을 허용
+        with self._lock:
+            health = self._get(model)
+            if health.state == "half_open":
+                health.probing = False
+
+    def is_open(self, model: str) -> bool:
+        with self._lock:
+            return self._get(model).state == "open"
+
+    def record(self, model: str, ok: bool, latency: float = None):
+        with self._lock:
+            health = self._get(model)
+            health.samples += 1
+            health.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * health.error_rate
+            if ok and latency is not None:
+                health.latency = latency if health.latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health.latency
+                )
+            if health.state == "half_open":
+                health.probing = False
+                if ok:
+                    # 시험 요청 성공 → 회로를 닫고 이전 기록은 잊음
+                    health.state = "closed"
+                    health.error_rate = 0.0
+                    health.latency = latency
+                else:
+                    health.state = "open"
+                    health.opened_at = time.monotonic()
+            elif health.state == "closed" and health.samples >= BREAKER_MIN_SAMPLES and (
+                health.error_rate >= BREAKER_ERROR_RATE
+                or (health.latency or 0) >= BREAKER_LATENCY_SECONDS
+            ):
+                health.state = "open"
+                health.opened_at = time.monotonic()
+                incr("resilience.breaker_opened")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                model: {
+                    "state": h.state,
+                    "error_rate": h.error_rate,
+                    "latency": h.latency,
+                    "samples": h.samples,
+                }
+                for model, h in self._models.items()
+            }
+
+
+_latency = LatencyTracker(LATENCY_WINDOW)
+_breaker = CircuitBreaker()
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _latency
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _breaker
+
+
+def fallback_chain(model: str) -> list:
+    return [model] + [m for m in FALLBACK_ORDER if m != model]
+
+
+def is_retryable(exc: Exception) -> bool:
+    # 모델 쪽 장애(5xx/타임아웃/연결 끊김)만. 429/한도 초과는 장애가 아니고 대개 조직 전체 한도라 다른 모델로 넘겨도 소용없음
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+def attempt_timeout(model: str, max_tokens: int = None) -> float:
+    # 비스트리밍 호출은 마감 시간이 곧 전체 응답 마감이므로, 출력량에 비해 짧으면 매번 타임아웃 → 재시도 → 대체 모델로 번짐
+    if not max_tokens:
+        return ATTEMPT_TIMEOUT
+    tokens_per_sec = MODEL_PROFILES.get(model, {}).get("tokens_per_sec", DEFAULT_TOKENS_PER_SEC)
+    return max(ATTEMPT_TIMEOUT, max_tokens / tokens_per_sec * ATTEMPT_TIMEOUT_MARGIN)
+
+
+def backoff_delay(attempt: int) -> float:
+    # full jitter: 0 ~ min(상한, base * 2^attempt) 사이에서 무작위 → 여러 세션이 동시에 재시도하지 않게 분산
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _hedged(model: str, fn, timeout: float):
+    delay = _latency.quantile(model, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+    primary = _hedge_pool.submit(fn, timeout)
+    if delay is None:
+        return primary.result(), False
+    done, _ = wait([primary], timeout=max(delay, HEDGE_MIN_DELAY))
+    if done:
+        return primary.result(), False
+
+    incr("resilience.hedges")
+    backup = _hedge_pool.submit(fn, timeout)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # 늦은 쪽은 취소할 수 없으므로 끝날 때까지 두고 결과만 버림
+                if future is backup:
+                    incr("resilience.hedge_wins")
+                return future.result(), True
+            error = future.exception()
+    raise error
+
+
+def call_resilient(model: str, fn, hedge: bool = False, max_tokens: int = None) -> dict:
+    # fn(timeout) 은 결과 dict 를 돌려주는 API 호출 1회. 시도별 지연/결과를 result["attempts"] 에 남김
+    timeout = attempt_timeout(model, max_tokens)
+    attempts = []
+    for attempt in range(MAX_ATTEMPTS):
+        started = time.perf_counter()
+        try:
+            if hedge and HEDGE_ENABLED:
+                result, hedged = _hedged(model, fn, timeout)
+            else:
+                result, hedged = fn(timeout), False
+        except Exception as exc:
+            attempts.append({"latency": time.perf_counter() - started, "outcome": type(exc).__name__})
+            incr("resilience.errors")
+            if is_rate_limited(exc):
+                # 스케줄러가 이미 대기 후 재시도하고도 남은 429 → 다시 재시도하지 않고, 모델 장애로도 세지 않음
+                raise
+            if not is_retryable(exc):
+                # 요청 자체의 문제(400 등)는 모델 장애가 아니므로 정상 응답으로 기록
+                _breaker.record(model, True)
+                raise
+            _breaker.record(model, False)
+            # 재시도 중에 회로가 열렸으면 더 기다리지 않고 다음 모델로 넘김
+            if attempt == MAX_ATTEMPTS - 1 or _breaker.is_open(model):
+                raise
+            incr("resilience.retries")
+            time.sleep(backoff_delay(attempt))
+            continue
+        elapsed = time.perf_counter() - started
+        attempts.append({"latency": elapsed, "outcome": "hedged" if hedged else "ok"})
+        # 대기열 시간은 빼고 실제 호출 시간만 p95 표본으로 씀
+        _latency.record(model, result.get("latency", elapsed))
+        # 회로 차단 지연 기준은 기본 마감 시간 기준으로 환산: 출력이 긴 요청이 오래 걸린 것을 모델 장애로 보지 않음
+        _breaker.record(model, True, result.get("latency", elapsed) * ATTEMPT_TIMEOUT / timeout)
+        result["attempts"] = attempts
+        return result
+
+
+def call_with_fallback(model: str, fn, hedge: bool = False, max_tokens: int = None) -> dict:
+    # fn(candidate_model, timeout) 은 API 호출 1회. 선택 모델의 회로가 열려 있거나 장애(5xx/타임아웃)로 실패하면
+    # FALLBACK_ORDER 의 다음 모델로 시도. 429/한도 초과는 더 비싼 모델로 넘기지 않고 그대로 올림
+    last_error = None
+    for candidate in fallback_chain(model):
+        if not _breaker.allow(candidate):
+            continue
+        try:
+            result = call_resilient(candidate, lambda timeout: fn(candidate, timeout), hedge, max_tokens)
+        except Exception as exc:
+            if not is_retryable(exc):
+                raise
+            last_error = exc
+            continue
+        finally:
+            # half-open 시험 요청이 어떤 경로로 끝나든 probing 을 풀어 회로가 half-open 에 갇히지 않게 함
+            _breaker.release(candidate)
+        if candidate != model:
+            incr("resilience.fallbacks")
+            result["fallback_from"] = model
+        return result
+    if last_error is not None:
+        raise last_error
+    # 모든 모델의 회로가 열려 있으면 선택한 모델로 그대로 시도
+    return call_resilient(model, lambda timeout: fn(model, timeout), hedge, max_tokens)
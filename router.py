@@ -0,0 +1,98 @@
+import math
+import os
+
+from segmenter import split_sentences
+from token_count import count_tokens
+
+# 대본 길이로 필요한 출력 토큰을 추정해 max_tokens 를 정하고, 그 출력량을 감당하는 모델 중 가장 싼 모델을 고름
+
+# 100만 토큰당 USD (입력, 출력), 최대 출력 토큰, 대략적인 출력 속도(토큰/초)
+MODEL_PROFILES = {
+    "gpt-4o-mini": {"input_cost": 0.15, "output_cost": 0.60, "max_output": 16384, "tokens_per_sec": 80},
+    "gpt-4o": {"input_cost": 2.50, "output_cost": 10.00, "max_output": 16384, "tokens_per_sec": 60},
+    "gpt-4.1": {"input_cost": 2.00, "output_cost": 8.00, "max_output": 32768, "tokens_per_sec": 60},
+}
+# 예상 생성 시간이 이보다 길면 더 빠른 모델을 우선
+LATENCY_BUDGET_SECONDS = float(os.getenv("ROUTER_LATENCY_BUDGET", "90"))
+
+# 제목 + 대본 분석 요약 + 스타일 래퍼 선언부
+HEADER_OUTPUT_TOKENS = 250
+# 영어 이미지 프롬프트의 묘사 부분(래퍼 제외) 평균 길이
+DESCRIPTION_TOKENS = 60
+# 형식 규칙상 문장마다 한국어 원문을 한 번 더 쓰고 영어 프롬프트가 붙으므로 원문 대비 출력이 대략 2배 이상
+KO_ECHO_FACTOR = 1.0
+# JSON 모드는 키/따옴표/이스케이프만큼 더 씀
+JSON_OVERHEAD = 1.2
+SAFETY_MARGIN = 1.2
+MIN_MAX_TOKENS = 256
+
+
+def estimate_pair_tokens(sentence: str, wrapper_tokens: int, compact: bool = False) -> int:
+    # 한 문장의 [한국어 원문] + [래퍼 + 영어 묘사] 두 줄 출력량
+    ko = count_tokens(sentence)
+    en = DESCRIPTION_TOKENS + (0 if compact else wrapper_tokens)
+    return math.ceil(ko * (1 + KO_ECHO_FACTOR)) + en + 6
+
+
+def plan_output_tokens(script: str, wrapper: str = "", mode: str = "single", compact: bool = False,
+                       header: bool = True) -> int:
+    sentences = split_sentences(script)
+    # 래퍼를 아직 모르면(분석 호출에서 정함) 기본 래퍼 길이 정도로 가정
+    wrapper_tokens = count_tokens(wrapper) if wrapper else 35
+    body = sum(estimate_pair_tokens(s, wrapper_tokens, compact) for s in sentences)
+    total = body + (HEADER_OUTPUT_TOKENS if header else 0)
+    if mode == "json":
+        total *= JSON_OVERHEAD
+    return max(MIN_MAX_TOKENS, math.ceil(total * SAFETY_MARGIN))
+
+
+def estimate_cost(model: str, prompt_tokens: int, output_tokens: int) -> float:
+    profile = MODEL_PROFILES[model]
+    return (prompt_tokens * profile["input_cost"] + output_tokens * profile["output_cost"]) / 1_000_000
+
+
+def route_request(model: str, output_tokens: int, prompt_tokens: int = 0, auto_model: bool = True,
+                  parallelism: int = 1) -> dict:
+    # auto_model=False 면 사용자가 고른 모델을 그대로 쓰고 max_tokens 만 맞춤
+    # 문장 분할/구간 병렬 모드는 출력이 여러 호출로 나뉘므로 호출 1건 기준으로 한도/지연/max_tokens 를 정함
+    per_call = max(MIN_MAX_TOKENS, math.ceil(output_tokens / max(1, parallelism)))
+    candidates = [model]
+    if auto_model:
+        candidates = sorted(
+            MODEL_PROFILES,
+            key=lambda m: estimate_cost(m, prompt_tokens, output_tokens),
+        )
+
+    chosen = None
+    reason = "선택 모델"
+    for candidate in candidates:
+        profile = MODEL_PROFILES.get(candidate)
+        if profile is None:
+            continue
+        fits = per_call <= profile["max_output"]
+        fast_enough = per_call / profile["tokens_per_sec"] <= LATENCY_BUDGET_SECONDS
+        if fits and fast_enough:
+            chosen = candidate
+            reason = "최저 비용" if auto_model else reason
+            break
+    if chosen is None and auto_model:
+        # 지연 예산을 맞추는 모델이 없으면(아주 긴 대본) 더 빠른 모델도 없으므로 출력 한도에 들어가는 가장 싼 모델,
+        # 그것도 없으면 출력 한도가 가장 큰 모델
+        fitting = [m for m in candidates if per_call <= MODEL_PROFILES[m]["max_output"]]
+        if fitting:
+            chosen, reason = fitting[0], "지연 예산 초과 · 최저 비용"
+        else:
+            chosen = max(MODEL_PROFILES, key=lambda m: MODEL_PROFILES[m]["max_output"])
+            reason = "출력 한도 우선"
+    if chosen is None:
+        chosen = model
+
+    max_output = MODEL_PROFILES.get(chosen, {}).get("max_output", per_call)
+    return {
+        "model": chosen,
+        "requested": model,
+        "max_tokens": min(per_call, max_output),
+        "estimated_output": output_tokens,
+        "estimated_cost": estimate_cost(chosen, prompt_tokens, output_tokens) if chosen in MODEL_PROFILES else None,
+        "reason": reason,
+    }
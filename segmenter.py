@@ -0,0 +1,85 @@
+import re
+
+# 한국어 대본을 로컬에서 결정적으로 문장/의미 단위로 나누는 분할기 (API 호출 없음)
+
+# 이보다 짧은 조각은 앞 문장에 붙임 (예: "네.", "그래서.")
+MIN_UNIT_CHARS = 4
+# 이보다 긴 문장은 쉼표가 붙은 연결 어미(~고, ~며, ~지만 …) 위치에서 한 번 더 나눔
+MAX_UNIT_CHARS = 120
+
+# 종결 부호(+닫는 따옴표/괄호) 뒤에 공백이 오는 지점을 문장 경계로 봄. "3.5" 같은 숫자는 공백이 없어 안전
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?。？！…])([\"'”’」』)\]]*)\s+")
+# 따옴표 없이 "~다." 로 끝나지 않는 대본도 많아, 줄바꿈은 항상 경계로 취급
+_LINE_SPLIT_RE = re.compile(r"\n+")
+# 인용문 뒤에 바로 인용 조사가 오면("…" 라고 말했다) 같은 문장으로 이어짐
+_QUOTATIVE_RE = re.compile(r"(?:이?라고|하고|이?라며|하며|이?라는|고\s)")
+_CLAUSE_BREAK_RE = re.compile(r"(?:고|며|서|지만|는데|은데|면서|니까|듯이|면)(,)\s+")
+
+
+def _split_line(line: str) -> list:
+    units = []
+    start = 0
+    for m in _SENTENCE_END_RE.finditer(line):
+        if m.group(1) and _QUOTATIVE_RE.match(line, m.end()):
+            continue
+        end = m.start() + len(m.group(1))
+        units.append(line[start:end])
+        start = m.end()
+    units.append(line[start:])
+    return [u.strip() for u in units if u.strip()]
+
+
+def _split_long(unit: str) -> list:
+    if len(unit) <= MAX_UNIT_CHARS:
+        return [unit]
+    breaks = list(_CLAUSE_BREAK_RE.finditer(unit))
+    if not breaks:
+        return [unit]
+    # 가운데에 가장 가까운 절 경계에서 나누고, 양쪽을 다시 검사
+    middle = len(unit) / 2
+    best = min(breaks, key=lambda m: abs(m.start(1) - middle))
+    left = unit[: best.end(1)].strip()
+    right = unit[best.end():].strip()
+    if not left or not right:
+        return [unit]
+    return _split_long(left) + _split_long(right)
+
+
+def split_sentences(text: str) -> list:
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    units = []
+    for line in _LINE_SPLIT_RE.split(text):
+        line = line.strip()
+        if not line:
+            continue
+        for unit in _split_line(line):
+            units.extend(_split_long(unit))
+
+    merged = []
+    for unit in units:
+        if merged and len(unit) < MIN_UNIT_CHARS:
+            merged[-1] = f"{merged[-1]} {unit}"
+        else:
+            merged.append(unit)
+    # 첫 조각이 너무 짧으면 다음 문장과 합침
+    if len(merged) > 1 and len(merged[0]) < MIN_UNIT_CHARS:
+        merged[1] = f"{merged[0]} {merged[1]}"
+        merged.pop(0)
+    return merged
+
+
+def make_windows(sentences: list, max_chars: int) -> list:
+    # 문장을 자르지 않고 순서대로 max_chars 이하의 구간(윈도우)으로 묶음
+    windows = []
+    current = []
+    size = 0
+    for sentence in sentences:
+        if current and size + len(sentence) > max_chars:
+            windows.append(current)
+            current = []
+            size = 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        windows.append(current)
+    return windows
@@ -0,0 +1,79 @@
+import copy
+import threading
+
+from metrics import incr
+
+# 동시에 들어온 같은 요청(같은 키)은 업스트림 호출 한 번만 보내고 결과를 함께 씀
+# 먼저 들어온 요청(leader)이 실제로 호출하고, 나머지(follower)는 끝날 때까지 기다렸다가 결과를 복사해 받음
+# 캐시와 달리 "진행 중인" 요청만 합치므로, 끝난 뒤에 들어온 요청은 새 호출(또는 캐시 조회)로 처리됨
+
+# follower 가 leader 의 스트리밍 중간 결과를 다시 그리는 간격(초)
+FOLLOWER_POLL_SECONDS = 0.1
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, on_delta=None):
+        # fn(emit) 을 실행해 결과 dict 를 돌려줌. 반환값: (result, shared)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.followers += 1
+
+        if not leader:
+            incr(f"{self.name}.shared")
+            return self._wait(call, on_delta), True
+
+        incr(f"{self.name}.calls")
+
+        def emit(partial):
+            call.partial = partial
+            if on_delta:
+                on_delta(partial)
+
+        try:
+            call.result = fn(emit)
+            # leader 도 복사본을 받음: 공유 원본(call.result)은 아무도 고쳐 쓰지 않게 둠
+            return copy.deepcopy(call.result), False
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _wait(self, call: _Call, on_delta):
+        shown = None
+        while not call.done.wait(FOLLOWER_POLL_SECONDS):
+            if on_delta and call.partial and call.partial != shown:
+                shown = call.partial
+                on_delta(shown)
+        if call.error is not None:
+            raise call.error
+        # 호출한 쪽에서 결과를 고쳐 써도(래퍼 적용, attempts 등 안쪽 목록 포함) 다른 세션에 영향이 없도록 깊은 복사
+        result = copy.deepcopy(call.result)
+        if on_delta:
+            on_delta(result["text"])
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
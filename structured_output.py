@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+import re
+
+# JSON 스키마 응답 모드: {title, analysis, style_wrapper, pairs: [{ko, en}]}
+# 스트리밍 중에도 pairs 배열의 원소가 하나 완성될 때마다 바로 꺼낼 수 있도록 증분 파서를 함께 제공
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "script_to_image",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "analysis": {"type": "string"},
+                "style_wrapper": {"type": "string"},
+                "pairs": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "ko": {"type": "string"},
+                            "en": {"type": "string"},
+                        },
+                        "required": ["ko", "en"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["title", "analysis", "style_wrapper", "pairs"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+JSON_MODE_RULE = (
+    "[JSON 출력 모드]\n"
+    "- 출력은 주어진 JSON 스키마 하나만 따른다. 마크다운이나 설명 문장을 덧붙이지 않는다.\n"
+    "- title: 제목, analysis: 대본 분석 요약(2~4문장), style_wrapper: 스타일 래퍼 문장,\n"
+    "  pairs: 의미 단위별 {ko: 한국어 원문, en: 영어 이미지 프롬프트} 목록 (원문 순서 유지).\n"
+    "- 나머지 지침(스타일 래퍼 규칙, 의미 단위 분할, 금지 사항)은 각 필드 내용에 그대로 적용한다."
+)
+
+_FIELD_RE = {
+    key: re.compile(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"' % key)
+    for key in ("title", "analysis", "style_wrapper")
+}
+
+
+class PairStreamParser:
+    # 누적 응답 텍스트를 update() 로 넘기면, 새로 완성된 pairs 원소만 돌려줌
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.pairs = []
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._last_key = None
+        self._pairs_depth = None
+        self._object_start = None
+
+    def update(self, text: str) -> list:
+        if not text.startswith(self._buffer):
+            # 이어쓰기 등으로 앞부분이 바뀌었으면 처음부터 다시 파싱
+            known = len(self.pairs)
+            self._reset()
+            self.update(text)
+            return self.pairs[known:]
+        self._buffer = text
+        new_pairs = []
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:self._pos]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch == ":":
+                self._last_key = self._last_string
+            elif ch in "{[":
+                if ch == "{" and self._pairs_depth is not None and self._depth == self._pairs_depth:
+                    self._object_start = self._pos
+                if ch == "[" and self._depth == 1 and self._last_key == "pairs":
+                    self._pairs_depth = self._depth + 1
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "]" and self._pairs_depth is not None and self._depth == self._pairs_depth - 1:
+                    self._pairs_depth = None
+                if ch == "}" and self._object_start is not None and self._depth == self._pairs_depth:
+                    try:
+                        item = json.loads(text[self._object_start:self._pos + 1])
+                    except ValueError:
+                        item = None
+                    self._object_start = None
+                    if isinstance(item, dict) and "ko" in item:
+                        pair = {"ko": str(item.get("ko", "")).strip(), "en": str(item.get("en", "")).strip()}
+                        self.pairs.append(pair)
+                        new_pairs.append(pair)
+            self._pos += 1
+        return new_pairs
+
+    def field(self, key: str) -> str:
+        # 아직 완성되지 않은 문자열 필드는 빈 문자열
+        m = _FIELD_RE[key].search(self._buffer)
+        if not m:
+            return ""
+        try:
+            return json.loads(f'"{m.group(1)}"')
+        except ValueError:
+            return m.group(1)
+
+
+def parse_document(text: str) -> dict:
+    # 완성된 응답을 파싱. 잘린 응답이면 증분 파서로 건질 수 있는 만큼 복구
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        doc = None
+    if isinstance(doc, dict):
+        pairs = [
+            {"ko": str(p.get("ko", "")).strip(), "en": str(p.get("en", "")).strip()}
+            for p in doc.get("pairs", [])
+            if isinstance(p, dict)
+        ]
+        return {
+            "title": str(doc.get("title", "")).strip(),
+            "analysis": str(doc.get("analysis", "")).strip(),
+            "style_wrapper": str(doc.get("style_wrapper", "")).strip(),
+            "pairs": pairs,
+            "complete": True,
+        }
+    parser = PairStreamParser()
+    parser.update(text or "")
+    return {
+        "title": parser.field("title"),
+        "analysis": parser.field("analysis"),
+        "style_wrapper": parser.field("style_wrapper"),
+        "pairs": parser.pairs,
+        "complete": False,
+    }
+
+
+def pairs_to_csv(pairs: list) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["ko", "en"])
+    for pair in pairs:
+        writer.writerow([pair.get("ko", ""), pair.get("en", "")])
+    return buf.getvalue()
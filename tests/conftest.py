@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import time
+import types
+
+import pytest
+
+# 캐시/메모리/기록 DB 는 모듈을 불러올 때 경로를 읽으므로, 테스트 모듈보다 먼저 임시 경로로 돌려놓음
+_tmp = tempfile.mkdtemp(prefix="visual-tests-")
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(_tmp, "response_cache.sqlite3"))
+os.environ.setdefault("TRANSLATION_MEMORY_PATH", os.path.join(_tmp, "translation_memory.sqlite3"))
+os.environ.setdefault("HISTORY_DB_PATH", os.path.join(_tmp, "history.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WRAPPER = "Shot on 35mm film, muted documentary tones."
+
+
+def full_output(sentences: list, wrapper: str = WRAPPER) -> str:
+    # 단일 호출 모드가 돌려주는 형태의 전체 출력 (제목 / 분석 / 래퍼 / 두 줄 세트)
+    pairs = "\n\n".join(
+        f"[한국어 원문] {sentence}\n[영어 이미지 프롬프트] {wrapper} scene {i}"
+        for i, sentence in enumerate(sentences)
+    )
+    return (
+        "⚡ 스크립트-투-이미지 시각화 프롬프트\n\n"
+        "대본 분석 요약:\n조용한 다큐 톤의 이야기.\n\n"
+        f"스타일 래퍼:\n{wrapper}\n\n"
+        f"문장별 변환:\n\n{pairs}"
+    )
+
+
+class FakeCompletions:
+    # 프롬프트 종류(문장 하나 / 머리말 / 단일 호출)에 따라 정해진 형태로 답하고, 받은 요청을 기록
+    # scripted 에 (text, finish_reason) 을 넣어 두면 그 순서대로 답함
+    def __init__(self):
+        self.calls = []
+        self.scripted = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        user = kwargs["messages"][-1]["content"]
+        finish_reason = "stop"
+        if self.scripted:
+            text, finish_reason = self.scripted.pop(0)
+        elif "\n문장:\n" in user:
+            sentence = user.rsplit("문장:\n", 1)[1]
+            text = f"[영어 이미지 프롬프트]: {WRAPPER} fresh scene of {len(sentence)}"
+        elif "'스타일 래퍼 선언' 단계만" in user:
+            text = f"대본 분석 요약:\n조용한 다큐 톤의 이야기.\n\n스타일 래퍼:\n{WRAPPER}"
+        else:
+            text = full_output([line for line in user.split("\n") if line.strip()])
+        usage = types.SimpleNamespace(
+            prompt_tokens=10, completion_tokens=5, total_tokens=15,
+            prompt_tokens_details=types.SimpleNamespace(cached_tokens=0),
+        )
+        message = types.SimpleNamespace(content=text)
+        return types.SimpleNamespace(
+            model=kwargs["model"], usage=usage,
+            choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason)],
+        )
+
+    def user_prompts(self) -> list:
+        return [call["messages"][-1]["content"] for call in self.calls]
+
+
+@pytest.fixture
+def fake_client():
+    completions = FakeCompletions()
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+
+
+@pytest.fixture
+def system_text():
+    # 테스트마다 다른 지침 → 응답 캐시/번역 메모리 범위가 테스트끼리 섞이지 않음
+    return f"테스트 지침 {time.time_ns()}"
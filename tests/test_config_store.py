@@ -0,0 +1,131 @@
+import pytest
+
+from config_store import JsonConfigStore, SqliteConfigStore, config_rows, rows_to_config
+
+CONFIG = {
+    "model_choice": "gpt-4o-mini",
+    "instruction_sets": [
+        {"id": "a", "name": "다큐", "inst_role": "역할 A"},
+        {"id": "b", "name": "예능", "inst_role": "역할 B"},
+    ],
+    "history": ["첫 입력", "둘째 입력"],
+}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        return JsonConfigStore(str(tmp_path / "config.json"), delay=0)
+    return SqliteConfigStore(str(tmp_path / "config.sqlite3"))
+
+
+def test_rows_round_trip():
+    assert rows_to_config(config_rows(CONFIG)) == CONFIG
+
+
+def test_sessions_editing_different_sets_keep_both_changes(store):
+    store.replace(CONFIG)
+    base = config_rows(store.load())
+    # 두 세션이 같은 스냅샷에서 서로 다른 set 을 고침
+    first, second = store.load(), store.load()
+    first["instruction_sets"][0]["inst_role"] = "역할 A2"
+    second["instruction_sets"][1]["inst_role"] = "역할 B2"
+    store.save(first, base)
+    store.save(second, base)
+
+    roles = [s["inst_role"] for s in store.load()["instruction_sets"]]
+    assert roles == ["역할 A2", "역할 B2"]
+
+
+def test_deleted_set_is_removed(store):
+    store.replace(CONFIG)
+    base = config_rows(store.load())
+    data = store.load()
+    data["instruction_sets"].pop(0)
+    store.save(data, base)
+    assert [s["id"] for s in store.load()["instruction_sets"]] == ["b"]
+
+
+def test_version_changes_on_write(store):
+    store.replace(CONFIG)
+    before = store.version()
+    base = config_rows(store.load())
+    data = store.load()
+    data["model_choice"] = "gpt-4.1"
+    store.save(data, base)
+    assert store.version() != before
+
+
+def counting_writes(store: JsonConfigStore) -> list:
+    writes = []
+    write = store._write
+
+    def counted(data):
+        writes.append(data)
+        write(data)
+
+    store._write = counted
+    return writes
+
+
+def test_unchanged_save_does_not_touch_disk(tmp_path):
+    store = JsonConfigStore(str(tmp_path / "config.json"), delay=0)
+    store.replace(CONFIG)
+    writes = counting_writes(store)
+    base = config_rows(store.load())
+
+    store.save(store.load(), base)
+
+    assert writes == []
+    assert not (tmp_path / "config.json.bak2").exists()
+
+
+def test_saves_within_delay_are_written_once(tmp_path):
+    store = JsonConfigStore(str(tmp_path / "config.json"), delay=60)
+    store.replace(CONFIG)
+    writes = counting_writes(store)
+    base = config_rows(store.load())
+
+    data = store.load()
+    data["model_choice"] = "gpt-4o"
+    base = store.save(data, base)
+    data["model_choice"] = "gpt-4.1"
+    store.save(data, base)
+    # 아직 쓰지 않은 변경도 load() 에는 보임
+    assert writes == []
+    assert store.load()["model_choice"] == "gpt-4.1"
+
+    store.flush()
+    assert len(writes) == 1
+    assert JsonConfigStore(str(tmp_path / "config.json")).load()["model_choice"] == "gpt-4.1"
+
+
+def test_corrupt_file_is_recovered_from_backup(tmp_path):
+    path = tmp_path / "config.json"
+    store = JsonConfigStore(str(path), delay=0)
+    store.replace(CONFIG)
+    base = config_rows(store.load())
+    data = store.load()
+    data["model_choice"] = "gpt-4.1"
+    store.save(data, base)
+    # 쓰다 만 파일
+    path.write_text('{"model_choice": "gpt-4', encoding="utf-8")
+
+    recovered = JsonConfigStore(str(path), delay=0).load()
+
+    assert recovered == CONFIG
+    assert (tmp_path / "config.json.corrupt").read_text(encoding="utf-8") == '{"model_choice": "gpt-4'
+    assert JsonConfigStore(str(path)).load() == CONFIG
+
+
+def test_write_leaves_no_temp_files_and_rotates_backups(tmp_path):
+    store = JsonConfigStore(str(tmp_path / "config.json"), delay=0, backups=2)
+    store.replace(CONFIG)
+    for model in ("gpt-4o", "gpt-4.1", "gpt-4o-mini"):
+        base = config_rows(store.load())
+        data = store.load()
+        data["model_choice"] = model
+        store.save(data, base)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["config.json", "config.json.bak1", "config.json.bak2"]
+    assert JsonConfigStore(str(tmp_path / "config.json.bak1")).load()["model_choice"] == "gpt-4.1"
@@ -0,0 +1,56 @@
+from generation import CONTINUE_PROMPT, format_metrics, run_chat, stitch
+from structured_output import RESPONSE_FORMAT
+
+
+def test_json_mode_does_not_auto_continue(fake_client, system_text):
+    truncated = '{"title": "t", "analysis": "a", "style_wrapper": "w", "pairs": [{"ko": "가", "en": "x"}, {"ko": "나'
+    fake_client.chat.completions.scripted = [(truncated, "length"), ('{"title": "t"', "length")]
+
+    result = run_chat(fake_client, "gpt-4o-mini", system_text, "대본", 100,
+                      auto_continue=True, response_format=RESPONSE_FORMAT)
+
+    assert len(fake_client.chat.completions.calls) == 1
+    assert result["text"] == truncated
+    assert result["finish_reason"] == "length"
+    assert result["continuations"] == 0
+    assert "JSON 모드는 이어쓰기 불가" in format_metrics(dict(result, structured=True))
+
+
+def test_stitch_drops_repeated_lines():
+    previous = "가 문장\nA prompt\n나 문장\nB prompt\n"
+    addition = "나 문장\nB prompt\n다 문장\nC prompt"
+    assert stitch(previous, addition) == "가 문장\nA prompt\n나 문장\nB prompt\n다 문장\nC prompt"
+
+
+def test_stitch_replaces_restarted_line():
+    previous = "가 문장\nA prompt\n나 문장\nB pro"
+    addition = "B prompt, rainy street\n다 문장"
+    assert stitch(previous, addition) == "가 문장\nA prompt\n나 문장\nB prompt, rainy street\n다 문장"
+
+
+def test_stitch_merges_overlapping_tail():
+    previous = "가 문장\nShot on film, a harbor at dawn with"
+    addition = "a harbor at dawn with fishing boats\n나 문장"
+    assert stitch(previous, addition) == "가 문장\nShot on film, a harbor at dawn with fishing boats\n나 문장"
+
+
+def test_stitch_appends_plain_continuation():
+    assert stitch("가 문장\nShot on fi", "lm, harbor") == "가 문장\nShot on film, harbor"
+    assert stitch("", "new") == "new"
+    assert stitch("old", "") == "old"
+
+
+def test_run_chat_continues_truncated_answer(fake_client, system_text):
+    fake_client.chat.completions.scripted = [
+        ("가 문장\nA prompt\n나 문장\nB pro", "length"),
+        ("B prompt\n다 문장\nC prompt", "stop"),
+    ]
+
+    result = run_chat(fake_client, "gpt-4o-mini", system_text, "대본", 100, auto_continue=True)
+
+    assert result["text"] == "가 문장\nA prompt\n나 문장\nB prompt\n다 문장\nC prompt"
+    assert result["continuations"] == 1
+    assert result["finish_reason"] == "stop"
+    second = fake_client.chat.completions.calls[1]["messages"]
+    assert second[-2] == {"role": "assistant", "content": "가 문장\nA prompt\n나 문장\nB pro"}
+    assert second[-1]["content"] == CONTINUE_PROMPT
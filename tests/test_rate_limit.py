@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket, retry_after_seconds, run_scheduled
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, message: str = "Rate limit reached. Please try again in 200ms."):
+        super().__init__(message)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter({"gpt-4o-mini": (6000, 1_000_000)})
+    monkeypatch.setattr(rate_limit, "_limiter", limiter)
+    return limiter
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(capacity=60, per_minute=60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    # 용량보다 큰 요청은 용량만큼만 기다림 (영원히 막히지 않음)
+    assert bucket.wait_time(600, now + 30) == pytest.approx(30.0)
+    bucket.give(1000)
+    assert bucket.tokens == 60
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(RateLimited()) == pytest.approx(0.2)
+    assert retry_after_seconds(RateLimited("no hint")) == rate_limit.DEFAULT_PAUSE_SECONDS
+
+
+def test_admission_is_fifo_during_pause(limiter):
+    limiter.pause("gpt-4o-mini", 0.3)
+    admitted = []
+
+    def request(i):
+        time.sleep(i * 0.02)
+        limiter.acquire("gpt-4o-mini", 10)
+        admitted.append(i)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(5)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert admitted == [0, 1, 2, 3, 4]
+    assert time.monotonic() - started >= 0.3
+
+
+def test_429_pauses_model_and_requeues(limiter):
+    calls = []
+
+    def api():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RateLimited()
+        return {"usage": {"total_tokens": 5}}
+
+    result = run_scheduled("gpt-4o-mini", 10, api)
+
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.2
+    assert result["queued"] >= 0.2
+
+
+def test_other_errors_are_not_requeued(limiter):
+    def api():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        run_scheduled("gpt-4o-mini", 10, api)
@@ -0,0 +1,75 @@
+import pytest
+
+import resilience
+from resilience import (
+    ATTEMPT_TIMEOUT,
+    BREAKER_COOLDOWN_SECONDS,
+    BREAKER_MIN_SAMPLES,
+    CircuitBreaker,
+    attempt_timeout,
+    call_with_fallback,
+)
+from router import MODEL_PROFILES
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker()
+    monkeypatch.setattr(resilience, "_breaker", breaker)
+    return breaker
+
+
+def open_then_cool_down(breaker: CircuitBreaker, model: str):
+    for _ in range(BREAKER_MIN_SAMPLES):
+        breaker.record(model, False)
+    assert breaker.is_open(model)
+    breaker._models[model].opened_at -= BREAKER_COOLDOWN_SECONDS
+
+
+def test_half_open_probe_released_after_429(breaker):
+    open_then_cool_down(breaker, "gpt-4o-mini")
+    calls = []
+
+    def rate_limited(model, timeout):
+        calls.append(model)
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        call_with_fallback("gpt-4o-mini", rate_limited)
+    assert calls == ["gpt-4o-mini"]
+
+    # 429 는 판정 없이 끝난 시험 요청 → 다음 호출이 다시 같은 모델로 시험할 수 있어야 함
+    result = call_with_fallback("gpt-4o-mini", lambda model, timeout: {"model": model, "latency": 0.1})
+    assert result["model"] == "gpt-4o-mini"
+    assert "fallback_from" not in result
+    assert breaker.snapshot()["gpt-4o-mini"]["state"] == "closed"
+
+
+def test_half_open_allows_one_probe_at_a_time(breaker):
+    open_then_cool_down(breaker, "gpt-4o-mini")
+    assert breaker.allow("gpt-4o-mini")
+    assert not breaker.allow("gpt-4o-mini")
+    breaker.release("gpt-4o-mini")
+    assert breaker.allow("gpt-4o-mini")
+
+
+def test_attempt_timeout_grows_with_max_tokens():
+    assert attempt_timeout("gpt-4o-mini") == ATTEMPT_TIMEOUT
+    assert attempt_timeout("gpt-4o-mini", 500) == ATTEMPT_TIMEOUT
+    # 라우터가 지연 예산 초과로 표시하는 크기(~12.6k 토큰)는 기본 마감 시간 안에 끝날 수 없음
+    assert attempt_timeout("gpt-4o-mini", 12600) > 12600 / MODEL_PROFILES["gpt-4o-mini"]["tokens_per_sec"]
+
+
+def test_long_call_gets_sized_deadline(breaker):
+    timeouts = []
+
+    def attempt(model, timeout):
+        timeouts.append(timeout)
+        return {"model": model, "latency": 0.1}
+
+    call_with_fallback("gpt-4o-mini", attempt, max_tokens=12600)
+    assert timeouts == [attempt_timeout("gpt-4o-mini", 12600)]
@@ -0,0 +1,34 @@
+from segmenter import MAX_UNIT_CHARS, make_windows, split_sentences
+
+
+def test_splits_on_sentence_ends_and_lines():
+    assert split_sentences("첫 문장이다. 둘째 문장이다!\r\n셋째 줄은 마침표가 없다\n\n넷째 줄이다?") == [
+        "첫 문장이다.", "둘째 문장이다!", "셋째 줄은 마침표가 없다", "넷째 줄이다?",
+    ]
+
+
+def test_keeps_decimals_and_quoted_speech_together():
+    assert split_sentences("가격은 3.5달러였다. 그는 \"가자.\" 라고 말했다.") == [
+        "가격은 3.5달러였다.", "그는 \"가자.\" 라고 말했다.",
+    ]
+
+
+def test_short_fragments_join_neighbours():
+    assert split_sentences("네. 지금부터 시작합니다. 그래서 샀다. 끝.") == [
+        "네. 지금부터 시작합니다.", "그래서 샀다. 끝.",
+    ]
+
+
+def test_long_sentence_splits_at_clause_break():
+    left = "바다를 건너 먼 항구까지 " * 5 + "갔고,"
+    right = "그 뒤에 높은 산을 넘어 " * 5 + "도착했다."
+    units = split_sentences(f"{left} {right}")
+    assert units == [left, right]
+    assert all(len(unit) <= MAX_UNIT_CHARS for unit in units)
+
+
+def test_windows_keep_sentences_whole_and_in_order():
+    sentences = ["가" * 5, "나" * 5, "다" * 5, "라" * 20]
+    windows = make_windows(sentences, 12)
+    assert windows == [["가" * 5, "나" * 5], ["다" * 5], ["라" * 20]]
+    assert [s for window in windows for s in window] == sentences
@@ -0,0 +1,36 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_leader_and_followers_get_independent_results():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    results = []
+
+    def upstream(emit):
+        release.wait(5)
+        return {"text": "same", "usage": {"total_tokens": 3}, "attempts": [{"outcome": "ok"}]}
+
+    def run():
+        results.append(flight.do("key", upstream))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    # 세 요청이 모두 같은 호출에 합류한 뒤에 업스트림을 끝냄
+    while flight._calls.get("key") is None or flight._calls["key"].followers < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    # 한쪽이 결과(안쪽 목록 포함)를 고쳐도 다른 쪽에는 보이지 않아야 함
+    first, _ = results[0]
+    first["text"] = "changed"
+    first["attempts"].append({"outcome": "mutated"})
+    for other, _ in results[1:]:
+        assert other["text"] == "same"
+        assert other["attempts"] == [{"outcome": "ok"}]
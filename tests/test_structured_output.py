@@ -0,0 +1,49 @@
+import json
+
+from structured_output import PairStreamParser, parse_document
+
+DOCUMENT = json.dumps({
+    "title": "제목",
+    "analysis": "다큐 톤.",
+    "style_wrapper": "Shot on film.",
+    "pairs": [
+        {"ko": "첫 문장. \"따옴표\" {괄호}", "en": "Shot on film. a harbor {at} dawn"},
+        {"ko": "둘째 문장.", "en": "Shot on film. gulls"},
+    ],
+}, ensure_ascii=False)
+
+
+def test_pair_split_across_chunks():
+    parser = PairStreamParser()
+    seen = []
+    # 한 글자씩 들어와도 원소가 완성되는 순간에만, 한 번씩 나옴
+    for end in range(1, len(DOCUMENT) + 1):
+        seen.extend(parser.update(DOCUMENT[:end]))
+    assert seen == [
+        {"ko": "첫 문장. \"따옴표\" {괄호}", "en": "Shot on film. a harbor {at} dawn"},
+        {"ko": "둘째 문장.", "en": "Shot on film. gulls"},
+    ]
+    assert parser.field("style_wrapper") == "Shot on film."
+
+
+def test_pair_not_emitted_until_object_closes():
+    parser = PairStreamParser()
+    cut = DOCUMENT.index('"en": "Shot on film. gulls"') + 10
+    assert len(parser.update(DOCUMENT[:cut])) == 1
+    assert parser.update(DOCUMENT) == [{"ko": "둘째 문장.", "en": "Shot on film. gulls"}]
+
+
+def test_restarted_text_is_reparsed():
+    parser = PairStreamParser()
+    parser.update(DOCUMENT[:DOCUMENT.index("둘째")])
+    assert len(parser.pairs) == 1
+    # 앞부분이 바뀐 텍스트가 오면 처음부터 다시 파싱하고, 새로 생긴 원소만 돌려줌
+    rewritten = DOCUMENT.replace("gulls", "gulls over the pier")
+    assert parser.update(" " + rewritten) == [{"ko": "둘째 문장.", "en": "Shot on film. gulls over the pier"}]
+
+
+def test_truncated_document_keeps_complete_pairs():
+    doc = parse_document(DOCUMENT[:DOCUMENT.index("둘째")])
+    assert doc["complete"] is False
+    assert doc["analysis"] == "다큐 톤."
+    assert [p["ko"] for p in doc["pairs"]] == ["첫 문장. \"따옴표\" {괄호}"]
@@ -0,0 +1,130 @@
+from conftest import WRAPPER, full_output
+from prompt_builder import prompt_cache_key
+from translation_memory import get_translation_memory, FAILED_PREFIX
+from visual_pipeline import execute_request, incremental_base, parse_header, parse_pairs, regenerate_pair
+
+SENTENCES = ["첫 장면은 새벽의 항구다.", "어부들이 그물을 끌어 올린다.", "갈매기가 낮게 날아간다."]
+
+
+def make_request(system_text: str, sentences: list, **overrides) -> dict:
+    script = "\n".join(sentences)
+    req = {
+        "mode": "single",
+        "model": "gpt-4o-mini",
+        "system_text": system_text,
+        "user_text": script,
+        "script": script,
+        "wrapper": "",
+        "compact_wrapper": False,
+        "stream": False,
+        "use_cache": True,
+        "auto_continue": False,
+        "max_tokens": 2000,
+        "verify": False,
+    }
+    req.update(overrides)
+    return req
+
+
+def wrapper_section(text: str) -> str:
+    return text.split("스타일 래퍼:\n", 1)[1].split("\n\n", 1)[0]
+
+
+def test_parse_header_stops_before_pairs():
+    analysis, wrapper = parse_header(full_output(SENTENCES))
+    assert analysis == "조용한 다큐 톤의 이야기."
+    assert wrapper == WRAPPER
+
+
+def test_incremental_run_from_single_mode_result(fake_client, system_text):
+    first = execute_request(fake_client, make_request(system_text, SENTENCES))
+    previous = incremental_base(first)
+    assert previous["wrapper"] == WRAPPER
+
+    edited = SENTENCES[:2] + ["갈매기가 높게 날아오른다."]
+    result = execute_request(fake_client, make_request(system_text, edited, previous=previous))
+
+    assert result["incremental"] == {"regenerated": 1, "reused": 2}
+    assert result["wrapper"] == WRAPPER
+    assert wrapper_section(result["text"]) == WRAPPER
+    # 바뀐 문장 하나만, 래퍼 한 문장만 담아 보냄
+    prompt = fake_client.chat.completions.user_prompts()[-1]
+    assert prompt.count("[한국어 원문]") == 0
+    assert f"스타일 래퍼:\n{WRAPPER}\n\n" in prompt
+    assert [p["ko"] for p in parse_pairs(result["text"])] == edited
+
+
+def test_switching_model_or_mode_skips_incremental_run(fake_client, system_text):
+    first = execute_request(fake_client, make_request(system_text, SENTENCES))
+    previous = incremental_base(first)
+
+    for overrides in ({"model": "gpt-4.1"}, {"mode": "chunk"}):
+        calls = len(fake_client.chat.completions.calls)
+        result = execute_request(fake_client, make_request(system_text, SENTENCES, previous=previous, **overrides))
+        assert "incremental" not in result
+        new_calls = fake_client.chat.completions.calls[calls:]
+        assert new_calls
+        assert {call["model"] for call in new_calls} == {overrides.get("model", "gpt-4o-mini")}
+
+def test_bypassing_cache_skips_incremental_run(fake_client, system_text):
+    first = execute_request(fake_client, make_request(system_text, SENTENCES))
+    previous = incremental_base(first)
+    calls = len(fake_client.chat.completions.calls)
+
+    result = execute_request(fake_client, make_request(system_text, SENTENCES, previous=previous, use_cache=False))
+
+    assert "incremental" not in result
+    assert len(fake_client.chat.completions.calls) == calls + 1
+
+
+def test_regenerate_pair_on_full_output(fake_client, system_text):
+    text = full_output(SENTENCES)
+    result = regenerate_pair(fake_client, "gpt-4o-mini", system_text, text, 1)
+
+    assert result["wrapper"] == WRAPPER
+    prompt = fake_client.chat.completions.user_prompts()[-1]
+    assert wrapper_section(prompt) == WRAPPER
+    assert prompt.endswith(f"문장:\n{SENTENCES[1]}")
+    pairs = parse_pairs(result["text"])
+    assert pairs[1]["en"] == result["line"]
+    assert [p["en"] for i, p in enumerate(pairs) if i != 1] == [p["en"] for i, p in enumerate(parse_pairs(text)) if i != 1]
+
+
+def test_translation_memory_reuses_single_mode_result(fake_client, system_text):
+    execute_request(fake_client, make_request(system_text, SENTENCES, translation_memory=True))
+    stored = get_translation_memory().lookup(prompt_cache_key(system_text), SENTENCES)
+    # 메모리에는 래퍼를 뺀 장면 묘사만 남음
+    assert [hit[0] for hit in stored] == [f"scene {i}" for i in range(len(SENTENCES))]
+
+    calls = len(fake_client.chat.completions.calls)
+    result = execute_request(fake_client, make_request(system_text, SENTENCES, mode="sentence",
+                                                       translation_memory=True))
+
+    assert result["tm"]["hits"] == len(SENTENCES)
+    # 머리말(분석/래퍼) 호출 하나만 나가고, 문장은 모두 메모리에서 채움
+    assert len(fake_client.chat.completions.calls) == calls + 1
+    for i, pair in enumerate(parse_pairs(result["text"])):
+        assert pair["en"] == f"{WRAPPER} scene {i}"
+
+
+def test_bypassing_cache_skips_translation_memory(fake_client, system_text):
+    execute_request(fake_client, make_request(system_text, SENTENCES, translation_memory=True))
+    calls = len(fake_client.chat.completions.calls)
+
+    result = execute_request(fake_client, make_request(system_text, SENTENCES, mode="sentence",
+                                                       translation_memory=True, use_cache=False))
+
+    assert "tm" not in result
+    assert len(fake_client.chat.completions.calls) == calls + 1 + len(SENTENCES)
+
+
+def test_regenerate_failed_line(fake_client, system_text):
+    text = full_output(SENTENCES).replace(f"{WRAPPER} scene 1", f"{FAILED_PREFIX}: timeout)")
+    pairs = parse_pairs(text)
+    assert [p["ko"] for p in pairs] == SENTENCES
+    assert pairs[1]["en"].startswith(FAILED_PREFIX)
+
+    result = regenerate_pair(fake_client, "gpt-4o-mini", system_text, text, 1)
+
+    assert FAILED_PREFIX not in result["text"]
+    assert parse_pairs(result["text"])[1]["en"] == result["line"]
@@ -0,0 +1,88 @@
+import hashlib
+import math
+import re
+import threading
+
+# 네트워크 없이 쓰는 토큰 수 추정기
+# tiktoken 과 인코딩 파일이 로컬에 있으면 정확히 세고, 없으면 o200k(gpt-4o 계열) 분절 규칙을 흉내 낸 근사치를 씀
+# 매 재실행마다 같은 지침 텍스트를 다시 세지 않도록 내용 해시로 결과를 기억
+
+# 근사치: 한글 음절은 대략 1토큰, 영문 단어는 4글자당 1토큰, 숫자는 3자리당 1토큰, 기호는 1글자당 1토큰
+_PIECE_RE = re.compile(r"[가-힣]+|[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d가-힣]")
+HANGUL_TOKENS_PER_CHAR = 1.0
+# 메시지 하나마다 역할/구분자로 붙는 토큰
+MESSAGE_OVERHEAD_TOKENS = 4
+# 내용 해시 캐시 최대 크기 (넘으면 비움)
+CACHE_MAX_ENTRIES = 4096
+
+_cache = {}
+_cache_lock = threading.Lock()
+_encoder = None
+_encoder_loaded = False
+
+
+def _load_encoder():
+    # 인코딩 파일을 내려받아야 하는 환경(오프라인)에서는 실패하므로 근사치로 대체
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+    _encoder_loaded = True
+    try:
+        import tiktoken
+
+        _encoder = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        _encoder = None
+    return _encoder
+
+
+def _approximate(text: str) -> int:
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isspace():
+            # 공백은 대부분 다음 단어 토큰에 붙음. 줄바꿈 묶음만 따로 셈
+            tokens += 1 if "\n" in piece else 0
+        elif "가" <= first <= "힣":
+            tokens += math.ceil(len(piece) * HANGUL_TOKENS_PER_CHAR)
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    encoder = _load_encoder()
+    count = len(encoder.encode(text)) if encoder is not None else _approximate(text)
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = count
+    return count
+
+
+def count_message_tokens(messages: list) -> int:
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def section_budget(sections: list) -> dict:
+    # sections: [(라벨, 텍스트), ...] → 섹션별 토큰/비중과 합계
+    rows = [(label, count_tokens((text or "").strip())) for label, text in sections]
+    total = sum(tokens for _, tokens in rows)
+    return {
+        "sections": [
+            {"label": label, "tokens": tokens, "share": tokens / total if total else 0.0}
+            for label, tokens in rows
+        ],
+        "total": total,
+    }
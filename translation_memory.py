@@ -0,0 +1,232 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+from metrics import incr
+
+# 번역 메모리: 한국어 문장(정규화) + 시스템 프롬프트 해시 → 영어 이미지 프롬프트(스타일 래퍼를 뺀 장면 묘사)
+# 오프닝/반복 내레이션/협찬 문구처럼 거의 같은 문장은 모델에 보내지 않고 메모리에서 채움
+# 비슷한 문장 찾기: 글자 n-gram 집합의 MinHash 를 LSH 밴드로 나눠 후보를 찾고, 후보는 실제 자카드 유사도로 판정
+TM_PATH = os.getenv("TRANSLATION_MEMORY_PATH", ".translation_memory.sqlite3")
+# 이 유사도 이상이면 메모리의 번역을 그대로 씀 (1.0 = 정규화 후 완전히 같은 문장만)
+TM_THRESHOLD = float(os.getenv("TM_THRESHOLD", "0.9"))
+# 한글은 한 글자에 정보가 많아 3-gram 이면 조사 하나만 달라도 유사도가 크게 떨어지므로 2-gram 사용
+NGRAM = 2
+NUM_PERM = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+# 한 문장에 대해 유사도를 직접 계산해 볼 최대 후보 수
+MAX_CANDIDATES = 50
+# 생성에 실패한 줄의 영어 자리 표시 (파이프라인이 채움). 이런 줄은 메모리에 저장하지 않음
+FAILED_PREFIX = "(생성 실패"
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_sentence(text: str) -> str:
+    # 전각/반각, 공백, 끝 문장부호 차이는 같은 문장으로 봄
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return " ".join(text.split()).rstrip(".!?。…~ ")
+
+
+def shingles(norm: str) -> set:
+    compact = norm.replace(" ", "")
+    if len(compact) <= NGRAM:
+        return {compact} if compact else set()
+    return {compact[i:i + NGRAM] for i in range(len(compact) - NGRAM + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(grams: set) -> list:
+    base = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams]
+    return [min((a * x + b) % _PRIME for x in base) for a, b in _PERMS] if base else []
+
+
+def band_keys(signature: list) -> list:
+    return [
+        (band, hashlib.blake2b(
+            repr(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).encode(), digest_size=8
+        ).hexdigest())
+        for band in range(BANDS)
+    ]
+
+
+def strip_wrapper(wrapper: str, line: str) -> str:
+    line = (line or "").strip()
+    if wrapper and line.startswith(wrapper):
+        return line[len(wrapper):].strip()
+    return line
+
+
+class TranslationMemory:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS memory (
+                    scope TEXT NOT NULL,
+                    norm TEXT NOT NULL,
+                    ko TEXT NOT NULL,
+                    en TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (scope, norm)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS memory_bands (
+                    scope TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    norm TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_bands ON memory_bands(scope, band, bucket)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, scope: str, sentences: list, threshold: float = TM_THRESHOLD) -> list:
+        # 문장마다 (장면 묘사, 유사도) 또는 None. 완전 일치를 먼저 보고, 없으면 LSH 후보 중 가장 비슷한 것
+        found = []
+        with self._connect() as conn:
+            for sentence in sentences:
+                norm = normalize_sentence(sentence)
+                row = conn.execute(
+                    "SELECT en FROM memory WHERE scope = ? AND norm = ?", (scope, norm)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE memory SET hits = hits + 1 WHERE scope = ? AND norm = ?", (scope, norm))
+                    found.append((row[0], 1.0))
+                    continue
+                if threshold >= 1.0:
+                    found.append(None)
+                    continue
+                found.append(self._fuzzy(conn, scope, norm, threshold))
+        return found
+
+    def _fuzzy(self, conn, scope: str, norm: str, threshold: float):
+        grams = shingles(norm)
+        signature = minhash(grams)
+        if not signature:
+            return None
+        candidates = set()
+        for band, bucket in band_keys(signature):
+            for (candidate,) in conn.execute(
+                "SELECT norm FROM memory_bands WHERE scope = ? AND band = ? AND bucket = ? LIMIT ?",
+                (scope, band, bucket, MAX_CANDIDATES),
+            ):
+                candidates.add(candidate)
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        best, best_score = None, threshold
+        for candidate in candidates:
+            score = jaccard(grams, shingles(candidate))
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        conn.execute("UPDATE memory SET hits = hits + 1 WHERE scope = ? AND norm = ?", (scope, best))
+        row = conn.execute("SELECT en FROM memory WHERE scope = ? AND norm = ?", (scope, best)).fetchone()
+        return (row[0], best_score) if row is not None else None
+
+    def store(self, scope: str, pairs: list, replace: bool = False):
+        # pairs: [(한국어 문장, 장면 묘사)]. 이미 있는 문장은 처음 저장한 번역을 유지
+        # replace=True: 사용자가 다시 생성한 줄처럼 기존 번역을 새 번역으로 바꿈
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for ko, en in pairs:
+                norm = normalize_sentence(ko)
+                if not norm or not en:
+                    continue
+                if replace and conn.execute(
+                    "UPDATE memory SET ko = ?, en = ?, created = ? WHERE scope = ? AND norm = ?",
+                    (ko, en, now, scope, norm),
+                ).rowcount:
+                    continue
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO memory (scope, norm, ko, en, created) VALUES (?, ?, ?, ?, ?)",
+                    (scope, norm, ko, en, now),
+                )
+                if cur.rowcount:
+                    conn.executemany(
+                        "INSERT INTO memory_bands (scope, band, bucket, norm) VALUES (?, ?, ?, ?)",
+                        [(scope, band, bucket, norm) for band, bucket in band_keys(minhash(shingles(norm)))],
+                    )
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, hits = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM memory").fetchone()
+        return {"entries": entries, "hits": hits}
+
+
+class MemorySession:
+    # 실행 1회 분의 번역 메모리 사용: 조회 결과/적중률을 모으고, 메모리에서 채운 문장은 다시 저장하지 않음
+    def __init__(self, memory: TranslationMemory, scope: str, threshold: float = TM_THRESHOLD):
+        self.memory = memory
+        self.scope = scope
+        self.threshold = threshold
+        self.lookups = 0
+        self.exact = 0
+        self.fuzzy = 0
+        self._served = set()
+
+    def lookup(self, sentences: list) -> list:
+        found = self.memory.lookup(self.scope, sentences, self.threshold)
+        for sentence, hit in zip(sentences, found):
+            if hit is None:
+                continue
+            self._served.add(normalize_sentence(sentence))
+            if hit[1] >= 1.0:
+                self.exact += 1
+            else:
+                self.fuzzy += 1
+        self.lookups += len(sentences)
+        incr("tm.lookups", len(sentences))
+        incr("tm.hits", sum(1 for hit in found if hit is not None))
+        return [hit[0] if hit is not None else None for hit in found]
+
+    def remember(self, pairs: list, wrapper: str):
+        fresh = [
+            (p["ko"], strip_wrapper(wrapper, p["en"]))
+            for p in pairs
+            if p.get("en") and not p["en"].startswith(FAILED_PREFIX)
+            and normalize_sentence(p["ko"]) not in self._served
+        ]
+        if fresh:
+            self.memory.store(self.scope, fresh)
+
+    def summary(self) -> dict:
+        return {"lookups": self.lookups, "hits": self.exact + self.fuzzy, "fuzzy": self.fuzzy}
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory() -> TranslationMemory:
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = TranslationMemory(TM_PATH)
+        return _memory
@@ -1,16 +1,61 @@
 import streamlit as st
-from openai import OpenAI
-import os
 import json
-from json import JSONDecodeError
+import time
 from uuid import uuid4
 
+from config_store import get_config_store
+from generation import format_metrics
+from history_store import get_history_store, history_meta, make_preview, recent_entry
+from metrics import get_metrics
+from openai_client import get_client
+from page_common import (
+    init_shared_config,
+    render_config_watch,
+    set_config_snapshot,
+    submit_generation_job,
+    render_job_panel,
+    render_service_stats,
+)
+from prompt_builder import (
+    compile_instruction_set,
+    get_compiled,
+    refresh_compiled,
+    append_volatile,
+    prompt_cache_key,
+    INSTRUCTION_KEYS,
+)
+from router import route_request, plan_output_tokens
+from structured_output import pairs_to_csv
+from token_count import count_tokens, section_budget
+from translation_memory import get_translation_memory, strip_wrapper, TM_THRESHOLD
+from visual_pipeline import (
+    execute_request,
+    incremental_base,
+    parse_pairs,
+    regenerate_pair,
+    LONG_SCRIPT_CHARS,
+    SENTENCE_WORKERS,
+)
+
 st.set_page_config(page_title="visualking", page_icon="📝", layout="centered")
 
-api_key = os.getenv("GPT_API_KEY")
-client = OpenAI(api_key=api_key)
+# 프로세스 전체가 공유하는 클라이언트 (재실행/세션마다 커넥션 풀을 새로 만들지 않음)
+client = get_client()
 
 CONFIG_PATH = "config.json"
+# 생성 기록 저장소에서 이 페이지의 기록을 구분하는 이름
+HISTORY_PAGE = "visual"
+# system_text 를 이루는 지침 섹션 (라벨, 세션 키) - 토큰 예산 표시에 사용
+INSTRUCTION_SECTIONS = [
+    ("1. 역할 지침", "inst_role"),
+    ("2. 톤 & 스타일 지침", "inst_tone"),
+    ("3. 콘텐츠 구성 지침", "inst_structure"),
+    ("4. 정보 밀도 & 조사 심도 지침", "inst_depth"),
+    ("5. 금지 지침", "inst_forbidden"),
+    ("6. 출력 형식 지침", "inst_format"),
+    ("7. 사용자 요청 반영 지침", "inst_user_intent"),
+    ("공통 이미지 지침", "common_image_instruction"),
+]
 
 st.markdown(
     """
@@ -58,6 +103,21 @@ st.session_state.setdefault(
 st.session_state.setdefault("current_input", "")
 st.session_state.setdefault("last_output", "")
 st.session_state.setdefault("model_choice", "gpt-4o-mini")
+st.session_state.setdefault("stream_mode", True)
+st.session_state.setdefault("bypass_cache", False)
+st.session_state.setdefault("auto_continue", True)
+st.session_state.setdefault("generation_mode", "single")
+st.session_state.setdefault("last_metrics", {})
+st.session_state.setdefault("last_pairs", [])
+st.session_state.setdefault("background_mode", True)
+st.session_state.setdefault("auto_route", False)
+st.session_state.setdefault("prompt_cache_order", False)
+st.session_state.setdefault("incremental_mode", True)
+st.session_state.setdefault("last_run", None)
+st.session_state.setdefault("use_translation_memory", True)
+st.session_state.setdefault("tm_threshold", TM_THRESHOLD)
+st.session_state.setdefault("jobs", [])
+st.session_state.setdefault("applied_jobs", [])
 
 # ===== 텍스트 지침 set 관련 상태 =====
 st.session_state.setdefault("instruction_sets", [])
@@ -82,13 +142,9 @@ st.session_state.setdefault("reset_input_value", "")
 
 
 def load_config():
-    if not os.path.exists(CONFIG_PATH):
-        return
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except JSONDecodeError:
-        return
+    data = get_config_store(CONFIG_PATH).load()
+    if not data:
+        return data
 
     # 텍스트 지침 기본 필드
     if isinstance(data.get("inst_role"), str):
@@ -109,7 +165,7 @@ def load_config():
 
     hist = data.get("history")
     if isinstance(hist, list):
-        st.session_state.history = hist[-5:]
+        st.session_state.history = [entry for entry in map(recent_entry, hist[-5:]) if entry]
 
     # 텍스트 지침 set
     if isinstance(data.get("instruction_sets"), list):
@@ -125,9 +181,11 @@ def load_config():
     if isinstance(data.get("common_image_instruction"), str):
         st.session_state.common_image_instruction = data["common_image_instruction"]
 
+    return data
 
-def save_config():
-    data = {
+def config_data() -> dict:
+    # config.json 형식 그대로의 저장/내보내기 데이터
+    return {
         "inst_role": st.session_state.inst_role,
         "inst_tone": st.session_state.inst_tone,
         "inst_structure": st.session_state.inst_structure,
@@ -142,13 +200,16 @@ def save_config():
         "active_image_instruction_set_id": st.session_state.get("active_image_instruction_set_id"),
         "common_image_instruction": st.session_state.get("common_image_instruction", ""),
     }
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def save_config():
+    # 마지막으로 읽은/쓴 상태와 비교해 이 세션이 바꾼 행만 저장소에 반영
+    store = get_config_store(CONFIG_PATH)
+    st.session_state.config_rows = store.save(config_data(), st.session_state.get("config_rows"))
 
 
 def reset_config():
-    if os.path.exists(CONFIG_PATH):
-        os.remove(CONFIG_PATH)
+    get_config_store(CONFIG_PATH).clear()
 
     for key in [
         "inst_role",
@@ -161,9 +222,11 @@ def reset_config():
         "history",
         "current_input",
         "last_output",
+        "config_rows",
         "model_choice",
         "instruction_sets",
         "active_instruction_set_id",
+        "applied_instruction_hash",
         "show_instruction_set_editor",
         "edit_instruction_set_id",
         "instset_toolbar_run_id",
@@ -188,17 +251,10 @@ def reset_config():
 
 
 def apply_instruction_set(set_obj: dict):
-    for key in [
-        "inst_role",
-        "inst_tone",
-        "inst_structure",
-        "inst_depth",
-        "inst_forbidden",
-        "inst_format",
-        "inst_user_intent",
-    ]:
+    for key in INSTRUCTION_KEYS:
         if key in set_obj:
             setattr(st.session_state, key, set_obj.get(key, ""))
+    st.session_state.applied_instruction_hash = get_compiled(set_obj, st.session_state.prompt_cache_order)["hash"]
     save_config()
 
 
@@ -216,6 +272,7 @@ def sync_active_set_field(field_name: str, value: str):
     for s in sets:
         if s.get("id") == active_id:
             s[field_name] = value
+            compile_instruction_set(s, st.session_state.prompt_cache_order)
             break
     st.session_state.instruction_sets = sets
     save_config()
@@ -228,17 +285,24 @@ def ensure_active_set_applied():
         return
     active_set = next((s for s in sets if s.get("id") == active_id), None)
     if active_set:
-        for key in [
-            "inst_role",
-            "inst_tone",
-            "inst_structure",
-            "inst_depth",
-            "inst_forbidden",
-            "inst_format",
-            "inst_user_intent",
-        ]:
+        # 같은 버전(내용 해시)이 이미 세션에 반영돼 있으면 매 재실행마다 필드를 다시 복사하지 않음
+        compiled = get_compiled(active_set, st.session_state.prompt_cache_order)
+        if st.session_state.get("applied_instruction_hash") == compiled["hash"]:
+            return
+        for key in INSTRUCTION_KEYS:
             if key in active_set:
                 setattr(st.session_state, key, active_set.get(key, ""))
+        st.session_state.applied_instruction_hash = compiled["hash"]
+
+
+def get_active_compiled() -> dict:
+    # 생성에 쓰는 컴파일된 지침(system_text / hash / tokens). 활성 set 이 없으면 세션 지침으로 즉석 컴파일
+    sets = st.session_state.get("instruction_sets", [])
+    active_id = st.session_state.get("active_instruction_set_id")
+    active_set = next((s for s in sets if s.get("id") == active_id), None)
+    if active_set is None:
+        active_set = {key: st.session_state.get(key, "") for key in INSTRUCTION_KEYS}
+    return get_compiled(active_set, st.session_state.prompt_cache_order)
 
 
 def ensure_active_image_set_applied():
@@ -251,33 +315,13 @@ def ensure_active_image_set_applied():
         st.session_state.common_image_instruction = active_set.get("content", "")
 
 
-def run_generation():
-    text = st.session_state.current_input.strip()
-    if not text:
-        return
-
-    # 히스토리는 그대로 유지 (원하면 나중에 text 일부만 저장하도록 변경 가능)
-    hist = st.session_state.history
-    if text in hist:
-        hist.remove(text)
-    hist.append(text)
-    st.session_state.history = hist[-5:]
-    save_config()
-
-    system_parts = [
-        st.session_state.inst_role,
-        st.session_state.inst_tone,
-        st.session_state.inst_structure,
-        st.session_state.inst_depth,
-        st.session_state.inst_forbidden,
-        st.session_state.inst_format,
-        st.session_state.inst_user_intent,
-        # visualking 특성상, 공통 이미지 지침도 system에 포함해도 됨
-        st.session_state.common_image_instruction,
-    ]
-    system_text = "\n\n".join(
-        part.strip() for part in system_parts if isinstance(part, str) and part.strip()
-    )
+def build_generation_request(text: str) -> dict:
+    # 백그라운드 작업 스레드는 st.session_state 를 읽을 수 없으므로, 실행에 필요한 값을 미리 스냅샷으로 만듦
+    # 지침 set 은 저장 시점에 컴파일돼 있으므로 다시 조립하지 않고 그대로 씀
+    compiled = get_active_compiled()
+    # visualking 특성상, 공통 이미지 지침도 system에 포함해도 됨
+    # 이미지 지침 set 을 바꿀 때마다 달라지므로 캐시 접두부가 깨지지 않게 맨 뒤에 둠
+    system_text = append_volatile(compiled["system_text"], [st.session_state.common_image_instruction])
 
     user_text = (
         "다음에 제공하는 대본(텍스트)을 위의 지침에 맞게 정돈하고, "
@@ -285,43 +329,183 @@ def run_generation():
         f"대본:\n{text}"
     )
 
-    with st.spinner("🎬 지침에 따라 대본을 변환하는 중입니다..."):
-        res = client.chat.completions.create(
-            model=st.session_state.model_choice,
-            messages=[
-                {"role": "system", "content": system_text},
-                {"role": "user", "content": user_text},
-            ],
-            max_tokens=800,
+    mode = st.session_state.generation_mode
+    # 한 번의 응답으로는 긴 대본 출력이 오래 걸리고 잘리기 쉬우므로, 단일 호출이어도 긴 대본은 구간 병렬로 처리
+    if mode == "single" and len(text) > LONG_SCRIPT_CHARS:
+        mode = "chunk"
+
+    # 대본의 문장 수/길이로 필요한 출력량을 추정해 max_tokens 와 모델을 정함
+    route = route_request(
+        st.session_state.model_choice,
+        plan_output_tokens(text, "", mode=mode, compact=False),
+        prompt_tokens=count_tokens(system_text + user_text),
+        auto_model=st.session_state.auto_route,
+        parallelism=SENTENCE_WORKERS if mode in ("sentence", "chunk") else 1,
+    )
+
+    return {
+        "mode": mode,
+        "model": route["model"],
+        "system_text": system_text,
+        "instruction_hash": compiled["hash"],
+        "user_text": user_text,
+        "script": text,
+        # 고정 스타일 래퍼가 없으므로 분석 호출에서 래퍼를 정함
+        "wrapper": "",
+        "compact_wrapper": False,
+        "stream": st.session_state.stream_mode,
+        "use_cache": not st.session_state.bypass_cache,
+        "auto_continue": st.session_state.auto_continue,
+        "max_tokens": route["max_tokens"],
+        "route": route,
+        "verify": False,
+        # 직전 실행과 비교해 바뀐 문장만 다시 생성
+        "previous": st.session_state.last_run if st.session_state.incremental_mode else None,
+        # 예전에 변환한 (비슷한) 문장은 번역 메모리에서 채움
+        "translation_memory": st.session_state.use_translation_memory,
+        "tm_threshold": st.session_state.tm_threshold,
+    }
+
+
+def apply_generation_result(result: dict):
+    st.session_state.last_output = result["text"]
+    st.session_state.last_metrics = result
+    # 문장 분할 / 긴 대본 / JSON 모드는 구조화된 쌍을 그대로 보관 (정규식으로 다시 긁지 않음)
+    st.session_state.last_pairs = result.get("pairs", [])
+    st.session_state.last_run = incremental_base(result)
+    # 결과 에디터가 이전 내용을 붙잡고 있지 않도록 위젯 상태를 비움
+    st.session_state.pop("output_editor", None)
+
+
+def record_history(req: dict, result: dict):
+    # 백그라운드 작업 스레드에서도 호출되므로 session_state 를 쓰지 않음
+    if result.get("text"):
+        get_history_store().append(HISTORY_PAGE, req["script"], result["text"], history_meta(result))
+
+
+def reopen_history(run_id: int):
+    # 버튼 콜백: 입력 위젯보다 먼저 실행되므로 입력창 내용도 바꿀 수 있음
+    run = get_history_store().get(run_id)
+    if run is None:
+        return
+    st.session_state.current_input = run["input"]
+    apply_generation_result(dict(run["meta"], text=run["output"], history_id=run_id))
+
+
+def regenerate_line(index: int):
+    # 버튼 콜백: 결과 에디터보다 먼저 실행되므로 결과 텍스트를 바꾸고 에디터 상태를 비울 수 있음
+    # 에디터에서 고친 내용이 있으면 그 텍스트를 기준으로 해당 줄만 바꿈
+    text = st.session_state.get("output_editor") or st.session_state.last_output
+    req = build_generation_request(st.session_state.current_input.strip())
+    try:
+        result = regenerate_pair(
+            client,
+            req["model"],
+            req["system_text"],
+            text,
+            index,
+            wrapper=st.session_state.last_metrics.get("wrapper", ""),
+            compact_wrapper=req["compact_wrapper"],
         )
+    except Exception as exc:
+        st.toast(f"❌ {index + 1}번째 줄 다시 생성 실패: {exc}")
+        return
+    st.session_state.last_output = result["text"]
+    st.session_state.pop("output_editor", None)
+    pairs = [{"ko": p["ko"], "en": p["en"]} for p in parse_pairs(result["text"])]
+    # 번역 메모리에 있던 문장이면 다시 생성한 줄로 바꿔 다음 실행에도 고친 번역을 씀
+    if st.session_state.use_translation_memory:
+        get_translation_memory().store(
+            prompt_cache_key(req["system_text"]),
+            [(pairs[index]["ko"], strip_wrapper(result.get("wrapper") or "", result["line"]))],
+            replace=True,
+        )
+    if st.session_state.last_pairs:
+        st.session_state.last_pairs = pairs
+    # 다음 실행의 "바뀐 문장만 다시 생성" 도 고친 줄을 재사용
+    if st.session_state.last_run:
+        st.session_state.last_run["pairs"] = pairs
+    usage = result.get("usage") or {}
+    st.toast(f"🔁 {index + 1}번째 줄을 다시 생성했습니다 · 출력 {usage.get('completion_tokens', 0)} 토큰")
+
+
+def push_recent(text: str):
+    # 최근 입력에는 내용 해시와 짧은 미리보기만 두고, 전문은 기록 저장소에 한 번만 저장
+    entry = {"hash": get_history_store().put_text(text), "preview": make_preview(text)}
+    hist = [h for h in st.session_state.history if h["hash"] != entry["hash"]]
+    hist.append(entry)
+    st.session_state.history = hist[-5:]
+    save_config()
+
+
+def load_recent(text_hash: str):
+    # 버튼 콜백: 누른 항목의 전문만 저장소에서 읽어 입력창에 넣음
+    text = get_history_store().get_text(text_hash)
+    if text is not None:
+        st.session_state.current_input = text
+
 
-    st.session_state.last_output = res.choices[0].message.content
+def run_generation(placeholder=None):
+    text = st.session_state.current_input.strip()
+    if not text:
+        return
+
+    push_recent(text)
+
+    req = build_generation_request(text)
+    if st.session_state.background_mode:
+        # 백그라운드 실행: 스크립트 스레드는 바로 돌아가고, 진행 상황은 작업 패널이 주기적으로 갱신
+        submit_generation_job(client, req, record_history)
+        return
+
+    # 스트리밍 모드: 토큰이 도착하는 대로 결과 영역(placeholder)에 바로 그림
+    on_delta = placeholder.markdown if (placeholder is not None and st.session_state.stream_mode) else None
+    on_pairs = None
+    if on_delta:
+        # JSON 스키마 모드: 완성된 문장 쌍을 도착하는 대로 표로 보여줌
+        def on_pairs(pairs):
+            placeholder.dataframe(pairs, use_container_width=True)
+
+    with st.spinner("🎬 지침에 따라 대본을 변환하는 중입니다..."):
+        result = execute_request(client, req, on_delta=on_delta, on_pairs=on_pairs)
+    record_history(req, result)
+    apply_generation_result(result)
 
 
 def build_instruction_preview(source: dict) -> str:
     parts = []
-    mapping = [
-        ("1. 역할 지침", "inst_role"),
-        ("2. 톤 & 스타일 지침", "inst_tone"),
-        ("3. 콘텐츠 구성 지침", "inst_structure"),
-        ("4. 정보 밀도 & 조사 심도 지침", "inst_depth"),
-        ("5. 금지 지침", "inst_forbidden"),
-        ("6. 출력 형식 지침", "inst_format"),
-        ("7. 사용자 요청 반영 지침", "inst_user_intent"),
+    texts = [
+        (label, source.get(key, "") if isinstance(source.get(key, ""), str) else "")
+        for label, key in INSTRUCTION_SECTIONS
     ]
-    for label, key in mapping:
-        value = source.get(key, "")
-        if isinstance(value, str) and value.strip():
-            parts.append(f"[{label}]\n{value.strip()}")
+    budget = section_budget(texts)
+    for (label, value), row in zip(texts, budget["sections"]):
+        if value.strip():
+            parts.append(f"[{label}] (약 {row['tokens']} 토큰)\n{value.strip()}")
     if not parts:
         return "지침 내용이 없습니다."
+    parts.append(f"합계: 약 {budget['total']} 토큰")
     return "\n\n".join(parts)
 
 
+def reload_config():
+    # 저장소에서 읽고, 저장소에 있던 키는 저장소 값 그대로를 이 세션의 기준 스냅샷으로 삼음
+    set_config_snapshot(load_config(), config_data())
+    # 이전 버전 config / 손으로 고친 set 은 다시 컴파일
+    refresh_compiled(st.session_state.instruction_sets, st.session_state.prompt_cache_order)
+    # 읽으면서 바꾼 부분(이전 형식 변환, 재컴파일)은 바로 저장소에 반영
+    save_config()
+
+
+def refresh_active_sets():
+    # 다른 세션의 변경을 다시 읽은 뒤: 활성 set 이 바뀌었을 수 있으므로 지침 필드를 다시 반영
+    st.session_state.pop("applied_instruction_hash", None)
+    ensure_active_set_applied()
+    ensure_active_image_set_applied()
+
+
 # ===== 최초 config 로드 =====
-if "config_loaded" not in st.session_state:
-    load_config()
-    st.session_state.config_loaded = True
+init_shared_config(CONFIG_PATH, reload_config, on_reload=refresh_active_sets)
 
 # 텍스트 지침 set 기본값
 if not st.session_state.instruction_sets:
@@ -336,6 +520,7 @@ if not st.session_state.instruction_sets:
         "inst_format": st.session_state.inst_format,
         "inst_user_intent": st.session_state.inst_user_intent,
     }
+    compile_instruction_set(default_set, st.session_state.prompt_cache_order)
     st.session_state.instruction_sets = [default_set]
     st.session_state.active_instruction_set_id = "default"
     save_config()
@@ -383,15 +568,25 @@ st.markdown(
 # ================== 사이드바 ==================
 with st.sidebar:
     st.markdown("<div class='sidebar-top'>", unsafe_allow_html=True)
+    render_config_watch(CONFIG_PATH)
 
     # (요청) 상단의 "지침 set" 블록과 버튼, separator는 제거
     # 바로 아래의 📘 지침부터 유지
 
     st.markdown("### 📘 지침")
+    prompt_budget = section_budget(
+        [(label, st.session_state.get(key, "")) for label, key in INSTRUCTION_SECTIONS]
+    )
+    largest = max(prompt_budget["sections"], key=lambda row: row["tokens"])
+    st.caption(
+        f"📏 시스템 프롬프트 약 {prompt_budget['total']} 토큰 · 매 호출마다 전송 · "
+        f"가장 큰 섹션: {largest['label']} ({largest['share'] * 100:.0f}%)"
+    )
 
     # ----- 텍스트 지침 설명 & 편집 -----
     with st.expander("1. 역할 지침 (Role Instructions)", expanded=False):
         st.caption("ChatGPT가 어떤 캐릭터 / 전문가 / 화자인지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_role)} 토큰")
         st.markdown(
             "- 예: `당신은 다큐멘터리 전문 내레이터이다.`\n"
             "- 예: `당신은 사건의 흐름을 촘촘히 짜주는 스토리텔링 편집자다.`\n"
@@ -411,6 +606,7 @@ with st.sidebar:
 
     with st.expander("2. 톤 & 스타일 지침", expanded=False):
         st.caption("어떤 분위기/문체/리듬으로 말할지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_tone)} 토큰")
         st.markdown(
             "- 예: `톤은 진지하고 저널리즘 스타일을 유지한다.`\n"
             "- 예: `첫 문장은 100% 강렬한 훅으로 시작한다.`\n"
@@ -430,6 +626,7 @@ with st.sidebar:
 
     with st.expander("3. 콘텐츠 구성 지침", expanded=False):
         st.caption("초반–중반–후반 또는 장면 흐름을 어떻게 짤지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_structure)} 토큰")
         st.markdown(
             "- 예: `인트로 → 배경 → 사건 → 인물 → 결론 단계로 전개하라.`\n"
             "- 예: `각 문단은 3~4문장으로 제한한다.`\n"
@@ -449,6 +646,7 @@ with st.sidebar:
 
     with st.expander("4. 정보 밀도 & 조사 심도 지침", expanded=False):
         st.caption("얼마나 깊게, 얼마나 촘촘하게 설명할지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_depth)} 토큰")
         st.markdown(
             "- 예: `사실 기반의 정보 비율을 50% 이상 유지.`\n"
             "- 예: `불필요한 수식어는 최소화.`\n"
@@ -468,6 +666,7 @@ with st.sidebar:
 
     with st.expander("5. 금지 지침 (Forbidden Rules)", expanded=False):
         st.caption("절대 쓰지 말아야 할 표현/스타일/토픽을 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_forbidden)} 토큰")
         st.markdown(
             "- 예: `예시나 비유를 남발하지 마라.`\n"
             "- 예: `독자에게 질문 형태로 말 걸지 말라.`\n"
@@ -487,6 +686,7 @@ with st.sidebar:
 
     with st.expander("6. 출력 형식 지침 (Output Format)", expanded=False):
         st.caption("길이, 단락, 제목, 마크다운 형식 등을 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_format)} 토큰")
         st.markdown(
             "- 예: `전체 500자 이상.`\n"
             "- 예: `소제목 없이 자연스러운 내레이션만 생성.`\n"
@@ -506,6 +706,7 @@ with st.sidebar:
 
     with st.expander("7. 사용자 요청 반영 지침", expanded=False):
         st.caption("사용자가 준 주제/키워드를 어떻게 스토리 안에 녹일지 정의합니다.")
+        st.caption(f"📏 약 {count_tokens(st.session_state.inst_user_intent)} 토큰")
         st.markdown(
             "- 예: `사용자가 입력한 키워드를 내러티브 중심축으로 사용한다.`\n"
             "- 예: `주제의 배경 정보를 먼저 파악한 뒤 스토리화한다.`"
@@ -631,6 +832,71 @@ with st.sidebar:
             label_visibility="collapsed",
         )
         st.session_state.model_choice = model
+        st.checkbox(
+            "대본 길이에 맞춰 모델 자동 선택 (가장 저렴한 모델)",
+            key="auto_route",
+            help="켜면 위에서 고른 모델 대신 출력량/지연 예산에 맞는 가장 싼 모델을 씁니다. 바뀐 경우 결과 지표에 표시됩니다.",
+        )
+        st.checkbox(
+            "스트리밍 출력 (토큰 단위로 바로 표시)",
+            key="stream_mode",
+        )
+        st.radio(
+            "생성 방식",
+            ["single", "sentence", "chunk", "json"],
+            format_func=lambda m: {
+                "single": "단일 호출",
+                "sentence": "문장 분할 (병렬)",
+                "chunk": "긴 대본 (구간 병렬)",
+                "json": "구조화 JSON",
+            }[m],
+            key="generation_mode",
+            horizontal=True,
+        )
+        st.checkbox(
+            "잘린 응답 자동 이어쓰기",
+            key="auto_continue",
+        )
+        st.checkbox(
+            "백그라운드 실행 (생성 중에도 편집 가능)",
+            key="background_mode",
+        )
+        st.checkbox(
+            "(실험) 고정 지침을 긴 것부터 정렬",
+            key="prompt_cache_order",
+            help="기본은 작성한 지침 순서 그대로 두고 자주 바뀌는 부분만 맨 뒤에 붙입니다. 캐시 적중률을 비교해 볼 때만 켜세요.",
+        )
+        st.checkbox(
+            "바뀐 문장만 다시 생성",
+            key="incremental_mode",
+            help="직전 결과와 같은 지침이면 대본에서 고치거나 추가한 문장만 모델에 보내고, 나머지는 직전 결과를 재사용합니다.",
+        )
+        st.checkbox(
+            "번역 메모리 사용",
+            key="use_translation_memory",
+            help="예전에 같은 지침으로 변환한 문장(오프닝, 반복 내레이션, 협찬 문구 등)은 모델에 보내지 않고 저장된 프롬프트를 씁니다. "
+                 "문장별/긴 대본 모드에서 적용되고, 단일 호출 결과도 메모리에 쌓입니다.",
+        )
+        st.slider(
+            "번역 메모리 유사도 기준",
+            min_value=0.7,
+            max_value=1.0,
+            step=0.01,
+            key="tm_threshold",
+            disabled=not st.session_state.use_translation_memory,
+            help="1.0 이면 (공백/문장부호를 무시하고) 완전히 같은 문장만, 낮출수록 조금 다른 문장도 메모리에서 채웁니다.",
+        )
+        tm_stats = get_translation_memory().stats()
+        counters = get_metrics()
+        st.caption(
+            f"번역 메모리: {tm_stats['entries']}문장 · "
+            f"이번 세션 적중 {counters.get('tm.hits', 0)}/{counters.get('tm.lookups', 0)}문장"
+        )
+        st.checkbox(
+            "응답 캐시 우회 (항상 새로 생성)",
+            key="bypass_cache",
+        )
+        render_service_stats()
 
     with st.expander("🧹 설정 초기화 (config.json)", expanded=False):
         st.caption("모든 지침, 최근 입력, config.json 파일을 초기화합니다. 되돌릴 수 없습니다.")
@@ -663,21 +929,7 @@ with st.sidebar:
     with st.expander("💾 config.json 내보내기 / 불러오기", expanded=False):
         st.caption("현재 설정을 파일로 저장하거나, 기존 config.json 파일을 불러올 수 있습니다.")
 
-        export_data = {
-            "inst_role": st.session_state.inst_role,
-            "inst_tone": st.session_state.inst_tone,
-            "inst_structure": st.session_state.inst_structure,
-            "inst_depth": st.session_state.inst_depth,
-            "inst_forbidden": st.session_state.inst_forbidden,
-            "inst_format": st.session_state.inst_format,
-            "inst_user_intent": st.session_state.inst_user_intent,
-            "history": st.session_state.history[-5:],
-            "instruction_sets": st.session_state.get("instruction_sets", []),
-            "active_instruction_set_id": st.session_state.get("active_instruction_set_id"),
-            "image_instruction_sets": st.session_state.get("image_instruction_sets", []),
-            "active_image_instruction_set_id": st.session_state.get("active_image_instruction_set_id"),
-            "common_image_instruction": st.session_state.get("common_image_instruction", ""),
-        }
+        export_data = config_data()
         export_json_str = json.dumps(export_data, ensure_ascii=False, indent=2)
         st.download_button(
             "⬇️ config.json 내보내기",
@@ -700,12 +952,13 @@ with st.sidebar:
             except Exception:
                 st.error("❌ JSON 파일을 읽는 중 오류가 발생했습니다. 올바른 config.json인지 확인해주세요.")
             else:
-                with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-                    f.write(raw)
+                get_config_store(CONFIG_PATH).replace(new_data)
 
                 if "config_loaded" in st.session_state:
                     del st.session_state["config_loaded"]
-                load_config()
+                reload_config()
+                # 새 config 의 지침을 다시 반영하도록 반영된 버전 기록을 지움
+                st.session_state.pop("applied_instruction_hash", None)
                 ensure_active_set_applied()
                 ensure_active_image_set_applied()
 
@@ -722,6 +975,7 @@ with st.sidebar:
                         "inst_format": st.session_state.inst_format,
                         "inst_user_intent": st.session_state.inst_user_intent,
                     }
+                    compile_instruction_set(default_set, st.session_state.prompt_cache_order)
                     st.session_state.instruction_sets = [default_set]
                     st.session_state.active_instruction_set_id = "default"
 
@@ -922,6 +1176,12 @@ if st.session_state.get("show_instruction_set_editor", False):
 
     st.markdown(f"## {title_text}")
 
+    if edit_mode and target_set:
+        with st.expander("📏 지침 미리보기 (섹션별 토큰)", expanded=False):
+            st.text(build_instruction_preview(target_set))
+            compiled = get_compiled(target_set, st.session_state.prompt_cache_order)
+            st.caption(f"지침 버전 {compiled['hash']} · system_text 약 {compiled['tokens']} 토큰")
+
     with st.form("instruction_set_editor_form"):
         set_name = st.text_input("지침 set 이름", value=default_name, placeholder="예: 다큐 기본셋 / 연애의 경제학 셋 등")
 
@@ -958,6 +1218,7 @@ if st.session_state.get("show_instruction_set_editor", False):
                     target_set["inst_forbidden"] = forbid_txt.strip()
                     target_set["inst_format"] = format_txt.strip()
                     target_set["inst_user_intent"] = intent_txt.strip()
+                    compile_instruction_set(target_set, st.session_state.prompt_cache_order)
                     for i, s in enumerate(st.session_state.instruction_sets):
                         if s.get("id") == edit_id:
                             st.session_state.instruction_sets[i] = target_set
@@ -976,6 +1237,8 @@ if st.session_state.get("show_instruction_set_editor", False):
                         "inst_format": format_txt.strip(),
                         "inst_user_intent": intent_txt.strip(),
                     }
+                    # 저장 시점에 system_text / 내용 해시 / 토큰 수를 만들어 set 에 함께 저장
+                    compile_instruction_set(new_set, st.session_state.prompt_cache_order)
                     st.session_state.instruction_sets.append(new_set)
                     st.session_state.active_instruction_set_id = new_id
 
@@ -1067,30 +1330,29 @@ if st.session_state.get("show_image_instruction_set_editor", False):
 
 # ----- 최근 입력 -----
 if st.session_state.history:
-    items = st.session_state.history[-5:]
-    html_items = ""
-    for h in items:
-        html_items += f"""
-<div style="
-    font-size:0.85rem;
-    color:#797979;
-    margin-bottom:4px;
-">{h}</div>
-"""
+    # 미리보기만 그리고(재실행마다 전문을 보내지 않음), 누른 항목의 전문만 저장소에서 불러옴
     st.markdown(
-        f"""<div style="
+        """<div style="
     max-width:460px;
-    margin:40px auto 40px auto;
+    margin:40px auto 10px auto;
 ">
-  <div style="margin-left:100px; text-align:left;">
-    <div style="font-size:0.8rem; color:#9ca3af; margin-bottom:10px;">
-      최근
-    </div>
-    {html_items}
+  <div style="margin-left:100px; font-size:0.8rem; color:#9ca3af; text-align:left;">
+    최근
   </div>
 </div>""",
         unsafe_allow_html=True,
     )
+    pad_left, recent_col, pad_right = st.columns([2, 5, 2])
+    with recent_col:
+        for entry in st.session_state.history[-5:]:
+            st.button(
+                entry["preview"] or "(빈 입력)",
+                key=f"recent_{entry['hash']}",
+                on_click=load_recent,
+                args=(entry["hash"],),
+                use_container_width=True,
+            )
+    st.markdown("<div style='height:40px;'></div>", unsafe_allow_html=True)
 else:
     st.markdown(
         """<div style="
@@ -1104,6 +1366,31 @@ else:
         unsafe_allow_html=True,
     )
 
+# ----- 생성 기록 검색 (입력/출력 전문 검색 → API 호출 없이 다시 열기) -----
+with st.expander("🔎 생성 기록 검색", expanded=False):
+    history_query = st.text_input(
+        "기록 검색",
+        key="history_query",
+        placeholder="입력이나 결과에 들어 있는 말로 검색",
+        label_visibility="collapsed",
+    )
+    runs = get_history_store().search(history_query, page=HISTORY_PAGE)
+    if not runs:
+        st.caption("저장된 기록이 없습니다." if not history_query.strip() else "검색 결과가 없습니다.")
+    for run in runs:
+        col_text, col_open = st.columns([5, 1])
+        with col_text:
+            created = time.strftime("%m-%d %H:%M", time.localtime(run["created"]))
+            st.caption(f"{created} · {run['model'] or '-'} · {run['preview']}")
+        with col_open:
+            st.button(
+                "열기",
+                key=f"history_open_{run['id']}",
+                on_click=reopen_history,
+                args=(run["id"],),
+                use_container_width=True,
+            )
+
 # ===== 메인 입력 영역 =====
 pad_left, center_col, pad_right = st.columns([1, 7, 1])
 
@@ -1123,14 +1410,28 @@ with center_col:
         label_visibility="collapsed",
     )
 
-    if st.button("지침 수행", use_container_width=True):
-        # run_generation() 안에서 st.session_state.current_input 을 그대로 사용
-        run_generation()
+    # 실행은 결과 영역에서 처리 (스트리밍 토큰을 결과 자리에 바로 그리기 위함)
+    run_clicked = st.button("지침 수행", use_container_width=True)
 
 
 st.markdown("<div style='height:24px;'></div>", unsafe_allow_html=True)
 
+# ===== 진행 중인 작업 =====
+if run_clicked and st.session_state.background_mode:
+    # 작업 제출만 하고 바로 아래 작업 패널에서 진행 상황을 보여줌
+    run_generation()
+render_job_panel(apply_generation_result)
+
 # ===== 결과 영역: 제목 가운데 정렬 + 넓은 texteditor =====
+if run_clicked and not st.session_state.background_mode:
+    st.markdown(
+        "<h3 style='text-align:center; margin-bottom:0.75rem;'>📄 변환된 결과</h3>",
+        unsafe_allow_html=True,
+    )
+    # run_generation() 안에서 st.session_state.current_input 을 그대로 사용
+    run_generation(st.empty())
+    st.rerun()
+
 if st.session_state.last_output:
     st.markdown(
         "<h3 style='text-align:center; margin-bottom:0.75rem;'>📄 변환된 결과</h3>",
@@ -1145,3 +1446,50 @@ if st.session_state.last_output:
     )
     # 에디터에서 수정한 내용 유지
     st.session_state.last_output = output_text
+    if st.session_state.last_metrics:
+        st.caption(format_metrics(st.session_state.last_metrics))
+
+    # 문장별 다시 생성: 잘못된 영어 프롬프트 한 줄만 다시 만들어 제자리에서 바꿈
+    line_pairs = parse_pairs(output_text)
+    if line_pairs:
+        with st.expander(f"🔁 문장별 다시 생성 ({len(line_pairs)}줄)", expanded=False):
+            for i, pair in enumerate(line_pairs):
+                col_text, col_button = st.columns([6, 1])
+                with col_text:
+                    st.caption(f"{i + 1}. {pair['ko']}  \n{pair['en']}")
+                with col_button:
+                    st.button(
+                        "🔁",
+                        key=f"regen_line_{i}",
+                        on_click=regenerate_line,
+                        args=(i,),
+                        help="이 줄의 영어 프롬프트만 다시 생성",
+                        use_container_width=True,
+                    )
+
+    # 구조화된 문장 쌍: 표로 보여주고 JSON / CSV 로 바로 내보내기
+    if st.session_state.last_pairs:
+        with st.expander(f"📋 문장별 표 ({len(st.session_state.last_pairs)}쌍)", expanded=False):
+            st.dataframe(st.session_state.last_pairs, use_container_width=True)
+            export_doc = {
+                "analysis": st.session_state.last_metrics.get("analysis", ""),
+                "style_wrapper": st.session_state.last_metrics.get("wrapper", ""),
+                "pairs": st.session_state.last_pairs,
+            }
+            col_json, col_csv = st.columns(2)
+            with col_json:
+                st.download_button(
+                    "⬇️ JSON 내보내기",
+                    data=json.dumps(export_doc, ensure_ascii=False, indent=2).encode("utf-8"),
+                    file_name="visual_prompts.json",
+                    mime="application/json",
+                    use_container_width=True,
+                )
+            with col_csv:
+                st.download_button(
+                    "⬇️ CSV 내보내기",
+                    data=pairs_to_csv(st.session_state.last_pairs).encode("utf-8-sig"),
+                    file_name="visual_prompts.csv",
+                    mime="text/csv",
+                    use_container_width=True,
+                )
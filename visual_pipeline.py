@@ -0,0 +1,698 @@
+import difflib
+import os
+import re
+import time
+
+from generation import run_chat, fan_out
+from prompt_builder import prompt_cache_key
+from router import plan_output_tokens
+from segmenter import split_sentences, make_windows
+from structured_output import PairStreamParser, parse_document, RESPONSE_FORMAT, JSON_MODE_RULE
+from translation_memory import get_translation_memory, MemorySession, TM_THRESHOLD, FAILED_PREFIX
+
+# 스크립트-투-이미지 출력(제목 / 대본 분석 요약 / 스타일 래퍼 / 문장별 변환)을
+# 문장 단위 호출로 나눠 병렬 생성하고 원래 순서대로 다시 조립
+
+OUTPUT_TITLE = "⚡ 스크립트-투-이미지 시각화 프롬프트"
+SENTENCE_WORKERS = int(os.getenv("SENTENCE_WORKERS", "8"))
+SENTENCE_MAX_TOKENS = 200
+HEADER_MAX_TOKENS = 400
+# 긴 대본 모드: 한 구간의 출력이 max_tokens 안에 들어오도록 구간 길이를 제한
+WINDOW_CHARS = 600
+# 단일 호출 모드에서 이보다 긴 대본은 자동으로 긴 대본(청크) 모드로 처리
+LONG_SCRIPT_CHARS = 3000
+PENDING_LINE = "…"
+# 바뀐 문장만 다시 생성: 새 대본에서 바뀐 문장 비율이 이보다 크면 분석/래퍼도 새로 만들도록 전체 재생성
+INCREMENTAL_MAX_CHANGED_RATIO = 0.5
+
+# 압축 래퍼 모드: 모델은 장면 묘사만 출력하고, 스타일 래퍼는 앱이 앞에 붙임 (문장당 출력 토큰 ~30개 절약)
+COMPACT_WRAPPER_RULE = (
+    "[압축 래퍼 모드]\n"
+    "- 이번 출력에서는 영어 이미지 프롬프트 앞에 공통 스타일 래퍼를 반복하지 않는다.\n"
+    "- 각 영어 이미지 프롬프트 줄에는 스타일 래퍼 뒤에 올 장면 묘사만 쓴다. 스타일 래퍼는 앱이 자동으로 붙인다.\n"
+    "- '스타일 래퍼:' 선언부는 그대로 한 번만 출력한다.\n"
+    "- 이 규칙은 앞의 스타일 래퍼 반복 규칙보다 우선한다."
+)
+
+_HANGUL_RE = re.compile(r"[가-힣]")
+_SECTION_LABELS = ("대본 분석", "스타일 래퍼", "문장별 변환")
+_LABEL_RE = re.compile(
+    r"^\s*(?:[-*•]\s*|\d+[.)]\s*|\[[^\]]*\]\s*[:：]?\s*|(?:english|prompt|영어(?:\s*이미지)?\s*프롬프트)\s*[:：]\s*)",
+    re.IGNORECASE,
+)
+
+
+def build_header_prompt(script: str, wrapper: str) -> str:
+    if wrapper:
+        wrapper_rule = f"스타일 래퍼는 다음 문장으로 고정되어 있으니 그대로 적어줘:\n{wrapper}"
+    else:
+        wrapper_rule = "대본 분석을 바탕으로 장르에 맞는 스타일 래퍼(영어 한 문장)를 선언해줘."
+    return (
+        "위 지침에 따라 아래 대본 전체를 분석해줘. 이번 요청은 '대본 분석 요약'과 '스타일 래퍼 선언' 단계만 처리한다.\n"
+        "제목과 문장별 변환은 출력하지 말고, 아래 형식으로만 출력해줘.\n\n"
+        "대본 분석 요약:\n(2~4문장)\n\n스타일 래퍼:\n(영어 한 문장)\n\n"
+        f"{wrapper_rule}\n\n"
+        f"대본:\n{script}"
+    )
+
+
+def build_sentence_prompt(sentence: str, wrapper: str, previous: str = "", compact: bool = False) -> str:
+    context = f"앞 문장(참고용, 변환하지 말 것):\n{previous}\n\n" if previous else ""
+    if compact:
+        line_rule = "영어 이미지 프롬프트에서 스타일 래퍼를 뺀 장면 묘사 한 줄만 출력해 (래퍼는 앱이 붙임).\n\n"
+    else:
+        line_rule = "영어 이미지 프롬프트 한 줄만 출력해.\n\n"
+    return (
+        "위 지침에 따라 '문장별 변환' 단계 중 아래 한국어 문장 하나만 처리해줘.\n"
+        "제목·대본 분석·스타일 래퍼 선언·한국어 원문 없이, " + line_rule +
+        f"스타일 래퍼:\n{wrapper}\n\n"
+        f"{context}"
+        f"문장:\n{sentence}"
+    )
+
+
+def build_window_prompt(window: list, index: int, total: int, analysis: str, wrapper: str,
+                        compact: bool = False) -> str:
+    compact_rule = "영어 줄에는 스타일 래퍼를 빼고 장면 묘사만 써 (래퍼는 앱이 붙임).\n" if compact else ""
+    return (
+        f"위 지침에 따라 긴 대본의 일부 구간({index + 1}/{total})만 처리해줘.\n"
+        "제목·대본 분석·스타일 래퍼 선언은 이미 끝났으니 출력하지 말고, "
+        "아래 구간의 '문장별 변환'만 두 줄 구조([한국어 원문] / [영어 이미지 프롬프트])로 출력해.\n"
+        f"{compact_rule}\n"
+        f"대본 분석 요약(공유 맥락):\n{analysis}\n\n"
+        f"스타일 래퍼:\n{wrapper}\n\n"
+        "구간 대본:\n" + "\n".join(window)
+    )
+
+
+def parse_header(text: str) -> tuple:
+    # 전체 출력(단일 호출 결과 포함)에서도 쓰므로 '문장별 변환' 이후는 읽지 않고,
+    # 래퍼(영어 한 문장)는 내용이 나온 뒤 첫 빈 줄에서 끝냄
+    analysis_lines = []
+    wrapper_lines = []
+    target = analysis_lines
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if target is wrapper_lines and wrapper_lines:
+                target = None
+            continue
+        if stripped.startswith(OUTPUT_TITLE):
+            continue
+        if stripped.lstrip("#*[ ").startswith("문장별 변환"):
+            break
+        if "스타일 래퍼" in stripped and (":" in stripped or "：" in stripped):
+            target = wrapper_lines
+            rest = re.split(r"[:：]", stripped, maxsplit=1)[1].strip()
+            if rest:
+                target.append(rest)
+            continue
+        if "분석" in stripped and (":" in stripped or "：" in stripped) and len(stripped) < 30:
+            target = analysis_lines
+            rest = re.split(r"[:：]", stripped, maxsplit=1)[1].strip()
+            if rest:
+                target.append(rest)
+            continue
+        if target is not None:
+            target.append(stripped)
+    return " ".join(analysis_lines).strip(), " ".join(wrapper_lines).strip()
+
+
+def clean_prompt_line(text: str) -> str:
+    # 모델이 라벨/번호/따옴표를 붙여도 영어 프롬프트 한 줄만 추려냄
+    for line in (text or "").splitlines():
+        line = _LABEL_RE.sub("", line).strip().strip('"“”').strip()
+        if line and not _HANGUL_RE.search(line):
+            return line
+    return (text or "").strip()
+
+
+def parse_pairs(text: str) -> list:
+    # 출력에서 (한국어 원문, 영어 프롬프트) 두 줄 세트만 추려냄. 제목/분석/래퍼 블록은 건너뜀
+    # ko_line / en_line 은 원문 text 에서의 줄 번호 (제자리 수정용)
+    pairs = []
+    pending = None
+    for index, line in enumerate((text or "").split("\n")):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(OUTPUT_TITLE):
+            continue
+        if stripped.lstrip("#*[ ").startswith(_SECTION_LABELS):
+            pending = None
+            continue
+        cleaned = _LABEL_RE.sub("", stripped).strip()
+        if not cleaned:
+            continue
+        # 실패 표시 줄도 한글을 담고 있지만 영어 자리이므로, 다시 생성할 수 있게 쌍으로 남김
+        if _HANGUL_RE.search(cleaned) and not (pending is not None and cleaned.startswith(FAILED_PREFIX)):
+            pending = (cleaned, index)
+        elif pending is not None:
+            pairs.append({
+                "ko": pending[0],
+                "en": cleaned.strip('"“”').strip(),
+                "ko_line": pending[1],
+                "en_line": index,
+            })
+            pending = None
+    return pairs
+
+
+def prepend_wrapper(wrapper: str, description: str) -> str:
+    description = (description or "").strip()
+    if not wrapper or description.startswith((wrapper, FAILED_PREFIX)):
+        return description
+    return f"{wrapper} {description}"
+
+
+def apply_style_wrapper(text: str, wrapper: str) -> str:
+    # 압축 래퍼 모드 출력의 영어 줄마다 스타일 래퍼를 앞에 붙여 원래 출력 형식으로 복원
+    if not wrapper:
+        return text
+    lines = (text or "").split("\n")
+    for pair in parse_pairs(text):
+        lines[pair["en_line"]] = prepend_wrapper(wrapper, pair["en"])
+    return "\n".join(lines)
+
+
+def verify_format(text: str, wrapper: str) -> list:
+    # inst_format 이 요구하는 형식(제목 / 분석 / 래퍼 선언 / 두 줄 세트 + 래퍼로 시작)을 검사해 문제 목록을 돌려줌
+    issues = []
+    text = text or ""
+    if OUTPUT_TITLE not in text:
+        issues.append("제목(⚡ 스크립트-투-이미지 시각화 프롬프트)이 없습니다.")
+    if "분석" not in text:
+        issues.append("대본 분석 요약이 없습니다.")
+    if "스타일 래퍼" not in text:
+        issues.append("스타일 래퍼 선언부가 없습니다.")
+    pairs = parse_pairs(text)
+    if not pairs:
+        issues.append("문장별 변환(한국어 → 영어 두 줄 세트)을 찾지 못했습니다.")
+    elif wrapper:
+        missing = [p for p in pairs if not p["en"].startswith(wrapper)]
+        if missing:
+            issues.append(f"스타일 래퍼로 시작하지 않는 영어 프롬프트 {len(missing)}/{len(pairs)}줄")
+    return issues
+
+
+def assemble_output(analysis: str, wrapper: str, pairs: list, compact: bool = False) -> str:
+    blocks = [
+        OUTPUT_TITLE,
+        f"대본 분석 요약:\n{analysis or PENDING_LINE}",
+        f"스타일 래퍼:\n{wrapper or PENDING_LINE}",
+        "문장별 변환:",
+    ]
+    for pair in pairs:
+        en = pair.get("en")
+        if en and compact:
+            en = prepend_wrapper(wrapper, en)
+        blocks.append(f"{pair['ko']}\n{en or PENDING_LINE}")
+    return "\n\n".join(blocks)
+
+
+def _sum_usage(results: list) -> dict:
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    for r in results:
+        if isinstance(r, dict):
+            for key in total:
+                total[key] += (r.get("usage") or {}).get(key, 0)
+    return total
+
+
+def _answered_models(results: list, requested: str) -> str:
+    # 대체 모델로 넘어간 호출이 섞일 수 있으므로 실제로 답한 모델을 모두 표시
+    models = sorted({r.get("model") or requested for r in results if isinstance(r, dict)})
+    return ", ".join(models) or requested
+
+
+def generate_by_sentence(client, model: str, system_text: str, script: str, wrapper: str = "",
+                         use_cache: bool = True, on_delta=None, auto_continue: bool = True,
+                         compact_wrapper: bool = False, on_progress=None,
+                         max_workers: int = SENTENCE_WORKERS, memory=None) -> dict:
+    started = time.perf_counter()
+    sentences = split_sentences(script)
+    pairs = [{"ko": s, "en": ""} for s in sentences]
+    state = {"analysis": "", "wrapper": wrapper, "first_done": None}
+    all_results = []
+
+    def call(user_text, max_tokens):
+        return run_chat(client, model, system_text, user_text, max_tokens,
+                        use_cache=use_cache, auto_continue=auto_continue)
+
+    def render():
+        if on_delta:
+            on_delta(assemble_output(state["analysis"], state["wrapper"], pairs, compact_wrapper))
+
+    def on_header(result):
+        all_results.append(result)
+        if isinstance(result, dict):
+            analysis, declared = parse_header(result["text"])
+            state["analysis"] = analysis
+            if not state["wrapper"]:
+                state["wrapper"] = declared
+
+    # 래퍼를 모르면(지침에 고정 래퍼가 없을 때) 분석 호출을 먼저 끝내야 문장 호출에 래퍼를 넘길 수 있음
+    header_prompt = build_header_prompt(script, wrapper)
+    if not wrapper:
+        on_header(call(header_prompt, HEADER_MAX_TOKENS))
+        render()
+
+    # 번역 메모리에 있는 문장은 래퍼만 붙여 바로 채우고, 나머지 문장만 모델에 보냄
+    remembered = memory.lookup(sentences) if memory else [None] * len(sentences)
+    jobs = [("header", header_prompt, None)] if wrapper else []
+    for i, sentence in enumerate(sentences):
+        if remembered[i] is not None:
+            pairs[i]["en"] = prepend_wrapper(state["wrapper"], remembered[i])
+            continue
+        previous = sentences[i - 1] if i > 0 else ""
+        jobs.append(("sentence", build_sentence_prompt(sentence, state["wrapper"], previous, compact_wrapper), i))
+
+    failed = 0
+    done_count = [0]
+
+    def on_result(index, result):
+        nonlocal failed
+        kind, _, sentence_index = jobs[index]
+        if kind == "header":
+            on_header(result)
+        else:
+            all_results.append(result)
+            if isinstance(result, dict):
+                pairs[sentence_index]["en"] = clean_prompt_line(result["text"])
+            else:
+                failed += 1
+                pairs[sentence_index]["en"] = f"{FAILED_PREFIX}: {result})"
+            if state["first_done"] is None:
+                state["first_done"] = time.perf_counter()
+        done_count[0] += 1
+        if on_progress:
+            on_progress(done_count[0], len(jobs))
+        render()
+
+    def run_job(job):
+        kind, prompt, _ = job
+        return call(prompt, HEADER_MAX_TOKENS if kind == "header" else SENTENCE_MAX_TOKENS)
+
+    render()
+    fan_out(run_job, jobs, max_workers, on_result=on_result)
+    if compact_wrapper:
+        for pair in pairs:
+            pair["en"] = prepend_wrapper(state["wrapper"], pair["en"])
+
+    finished = time.perf_counter()
+    ok_results = [r for r in all_results if isinstance(r, dict)]
+    return {
+        "text": assemble_output(state["analysis"], state["wrapper"], pairs),
+        "finish_reason": "stop" if not failed else "error",
+        "model": _answered_models(all_results, model),
+        "fallbacks": sum(1 for r in ok_results if r.get("fallback_from")),
+        "usage": _sum_usage(all_results),
+        "ttft": (state["first_done"] or finished) - started,
+        "latency": finished - started,
+        "cache_hit": bool(ok_results) and all(r.get("cache_hit") for r in ok_results),
+        "calls": sum(1 for r in ok_results if not r.get("cache_hit")),
+        "continuations": sum(r.get("continuations", 0) for r in ok_results),
+        "sentences": len(sentences),
+        "failed": failed,
+        "pairs": pairs,
+        "analysis": state["analysis"],
+        "wrapper": state["wrapper"],
+    }
+
+
+def generate_by_chunks(client, model: str, system_text: str, script: str, wrapper: str = "",
+                       use_cache: bool = True, on_delta=None, auto_continue: bool = True,
+                       compact_wrapper: bool = False, on_progress=None,
+                       window_chars: int = WINDOW_CHARS, max_workers: int = SENTENCE_WORKERS,
+                       memory=None) -> dict:
+    # map-reduce: 분석/래퍼(공유 맥락)를 먼저 만든 뒤 구간별 문장 변환을 병렬 처리하고 순서대로 합침
+    started = time.perf_counter()
+    sentences = split_sentences(script)
+    remembered = memory.lookup(sentences) if memory else [None] * len(sentences)
+
+    def call(user_text, max_tokens):
+        return run_chat(client, model, system_text, user_text, max_tokens,
+                        use_cache=use_cache, auto_continue=auto_continue)
+
+    header = call(build_header_prompt(script, wrapper), HEADER_MAX_TOKENS)
+    analysis, declared = parse_header(header["text"])
+    wrapper = wrapper or declared
+    all_results = [header]
+
+    # 번역 메모리에 없는 문장만 연속 구간끼리 묶어 나누고, 메모리에서 채운 문장은 원래 자리에 끼워 넣음
+    # segments: ("window", 구간 번호) 또는 ("memory", pair) 를 대본 순서대로
+    windows = []
+    segments = []
+    novel = []
+
+    def close_novel():
+        for window in make_windows(novel, window_chars):
+            segments.append(("window", len(windows)))
+            windows.append(window)
+        novel.clear()
+
+    for sentence, description in zip(sentences, remembered):
+        if description is None:
+            novel.append(sentence)
+            continue
+        close_novel()
+        segments.append(("memory", {"ko": sentence, "en": prepend_wrapper(wrapper, description)}))
+    close_novel()
+
+    window_pairs = [[{"ko": s, "en": ""} for s in window] for window in windows]
+    state = {"first_done": None}
+    failed = 0
+    done_count = [0]
+
+    def ordered_pairs():
+        return [p for kind, seg in segments for p in (window_pairs[seg] if kind == "window" else [seg])]
+
+    def render():
+        if on_delta:
+            on_delta(assemble_output(analysis, wrapper, ordered_pairs(), compact_wrapper))
+
+    def on_result(index, result):
+        nonlocal failed
+        all_results.append(result)
+        if isinstance(result, dict):
+            parsed = [{"ko": p["ko"], "en": p["en"]} for p in parse_pairs(result["text"])]
+            # 모델이 형식을 지키지 않았으면 원문을 그대로 남겨 누락되지 않게 함
+            window_pairs[index] = parsed or [{"ko": "\n".join(windows[index]), "en": result["text"].strip()}]
+        else:
+            failed += 1
+            for pair in window_pairs[index]:
+                pair["en"] = f"{FAILED_PREFIX}: {result})"
+        if state["first_done"] is None:
+            state["first_done"] = time.perf_counter()
+        done_count[0] += 1
+        if on_progress:
+            on_progress(done_count[0], len(windows))
+        render()
+
+    render()
+    # 구간마다 문장 수/길이로 출력량을 추정해 max_tokens 를 정함 (고정값이면 긴 구간이 잘림)
+    prompts = [
+        (
+            build_window_prompt(window, i, len(windows), analysis, wrapper, compact_wrapper),
+            plan_output_tokens("\n".join(window), wrapper, compact=compact_wrapper, header=False),
+        )
+        for i, window in enumerate(windows)
+    ]
+    fan_out(lambda p: call(*p), prompts, max_workers, on_result=on_result)
+
+    finished = time.perf_counter()
+    ok_results = [r for r in all_results if isinstance(r, dict)]
+    pairs = ordered_pairs()
+    if compact_wrapper:
+        for pair in pairs:
+            pair["en"] = prepend_wrapper(wrapper, pair["en"])
+    return {
+        "text": assemble_output(analysis, wrapper, pairs),
+        "finish_reason": "stop" if not failed else "error",
+        "model": _answered_models(all_results, model),
+        "fallbacks": sum(1 for r in ok_results if r.get("fallback_from")),
+        "usage": _sum_usage(all_results),
+        "ttft": (state["first_done"] or finished) - started,
+        "latency": finished - started,
+        "cache_hit": all(r.get("cache_hit") for r in ok_results),
+        "calls": sum(1 for r in ok_results if not r.get("cache_hit")),
+        "continuations": sum(r.get("continuations", 0) for r in ok_results),
+        "sentences": len(pairs),
+        "windows": len(windows),
+        "failed": failed,
+        "pairs": pairs,
+        "analysis": analysis,
+        "wrapper": wrapper,
+    }
+
+
+def generate_structured(client, model: str, system_text: str, user_text: str, max_tokens: int,
+                        wrapper: str = "", compact_wrapper: bool = False, stream: bool = True,
+                        use_cache: bool = True, auto_continue: bool = True, on_pairs=None) -> dict:
+    # JSON 스키마 모드: 완성된 pairs 원소를 스트리밍 중에 바로 on_pairs 로 넘기고,
+    # 끝나면 기존 텍스트 형식으로도 조립해 나머지 화면/내보내기와 호환되게 함
+    parser = PairStreamParser()
+
+    def emit(partial):
+        if parser.update(partial):
+            current = parser.pairs
+            if compact_wrapper:
+                current = [{"ko": p["ko"], "en": prepend_wrapper(wrapper, p["en"])} for p in current]
+            on_pairs(current)
+
+    result = run_chat(
+        client,
+        model,
+        f"{system_text}\n\n{JSON_MODE_RULE}",
+        user_text,
+        max_tokens,
+        stream=stream,
+        on_delta=emit if on_pairs else None,
+        use_cache=use_cache,
+        auto_continue=auto_continue,
+        response_format=RESPONSE_FORMAT,
+    )
+    doc = parse_document(result["text"])
+    wrapper = wrapper or doc["style_wrapper"]
+    pairs = doc["pairs"]
+    if compact_wrapper:
+        pairs = [{"ko": p["ko"], "en": prepend_wrapper(wrapper, p["en"])} for p in pairs]
+    if not doc["complete"] and result["finish_reason"] == "stop":
+        result["finish_reason"] = "error"
+    result.update({
+        "raw_json": result["text"],
+        "text": assemble_output(doc["analysis"], wrapper, pairs),
+        "pairs": pairs,
+        "analysis": doc["analysis"],
+        "wrapper": wrapper,
+        "structured": True,
+    })
+    return result
+
+
+def regenerate_pair(client, model: str, system_text: str, text: str, index: int, wrapper: str = "",
+                    compact_wrapper: bool = False) -> dict:
+    # 결과 text 의 index 번째 두 줄 세트만 다시 생성해 영어 줄을 제자리에서 바꿈 (문장 1개 + 래퍼 + 규칙만 전송)
+    # 같은 답이 다시 나오지 않도록 응답 캐시는 쓰지 않음
+    pairs = parse_pairs(text)
+    pair = pairs[index]
+    wrapper = wrapper or parse_header(text)[1]
+    previous = pairs[index - 1]["ko"] if index > 0 else ""
+    result = run_chat(client, model, system_text,
+                      build_sentence_prompt(pair["ko"], wrapper, previous, compact_wrapper),
+                      SENTENCE_MAX_TOKENS, use_cache=False, auto_continue=False)
+    line = clean_prompt_line(result["text"])
+    if compact_wrapper:
+        line = prepend_wrapper(wrapper, line)
+    lines = text.split("\n")
+    lines[pair["en_line"]] = line
+    result["line"] = line
+    result["wrapper"] = wrapper
+    result["text"] = "\n".join(lines)
+    return result
+
+
+def _sentence_key(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def incremental_base(result: dict):
+    # 다음 실행에서 바뀐 문장만 다시 만들 수 있도록 이번 결과의 대본 / 문장→프롬프트 대응 / 분석 / 래퍼를 남김
+    source = result.get("source")
+    # 실패/잘린 문장은 대응에서 빠지므로 다음 실행에서 다시 생성됨
+    if not source or result.get("structured"):
+        return None
+    pairs = result.get("pairs") or parse_pairs(result.get("text", ""))
+    analysis, wrapper = result.get("analysis"), result.get("wrapper")
+    if not analysis or not wrapper:
+        parsed_analysis, parsed_wrapper = parse_header(result.get("text", ""))
+        analysis, wrapper = analysis or parsed_analysis, wrapper or parsed_wrapper
+    pairs = [{"ko": p["ko"], "en": p["en"]} for p in pairs if p.get("en") and not p["en"].startswith(FAILED_PREFIX)]
+    if not pairs or not wrapper:
+        return None
+    return {
+        "script": source["script"],
+        "system_key": source["system_key"],
+        "model": source.get("model"),
+        "mode": source.get("mode"),
+        "pairs": pairs,
+        "analysis": analysis,
+        "wrapper": wrapper,
+    }
+
+
+def generate_incremental(client, model: str, system_text: str, script: str, previous: dict,
+                         use_cache: bool = True, on_delta=None, auto_continue: bool = True,
+                         compact_wrapper: bool = False, on_progress=None,
+                         max_workers: int = SENTENCE_WORKERS, memory=None, mode: str = ""):
+    # 이전 실행과 같은 지침·모델·생성 방식이면 대본을 문장 단위로 비교(difflib)해 바뀌거나 추가된 문장만 모델에 보냄
+    # 분석 요약/스타일 래퍼는 이전 실행 것을 그대로 쓰고, 결과는 새 대본 순서대로 다시 조립
+    # 다시 만들 문장이 너무 많으면 None → 호출한 쪽에서 전체 생성
+    if previous.get("system_key") != prompt_cache_key(system_text):
+        return None
+    # 모델(자동 선택 포함)이나 생성 방식이 바뀌었으면 이전 줄을 새 설정의 결과로 내보내지 않음
+    if (previous.get("model"), previous.get("mode")) != (model, mode):
+        return None
+    started = time.perf_counter()
+    old_sentences = split_sentences(previous["script"])
+    sentences = split_sentences(script)
+    known = {_sentence_key(p["ko"]): p["en"] for p in previous["pairs"]}
+    analysis, wrapper = previous["analysis"], previous["wrapper"]
+
+    pairs = [{"ko": s, "en": ""} for s in sentences]
+    matcher = difflib.SequenceMatcher(None, [_sentence_key(s) for s in old_sentences],
+                                      [_sentence_key(s) for s in sentences], autojunk=False)
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            continue
+        for j in range(j1, j2):
+            pairs[j]["en"] = known.get(_sentence_key(sentences[j]), "")
+    todo = [i for i, pair in enumerate(pairs) if not pair["en"]]
+    if not sentences or len(todo) > len(sentences) * INCREMENTAL_MAX_CHANGED_RATIO:
+        return None
+    reused = len(sentences) - len(todo)
+    # 바뀐 문장 중에서도 번역 메모리에 있는 것은 모델에 보내지 않음
+    if memory and todo:
+        remembered = memory.lookup([sentences[i] for i in todo])
+        for i, description in zip(todo, remembered):
+            if description is not None:
+                pairs[i]["en"] = prepend_wrapper(wrapper, description)
+        todo = [i for i in todo if not pairs[i]["en"]]
+
+    state = {"first_done": None}
+    all_results = []
+    failed = 0
+    done_count = [0]
+
+    def render():
+        if on_delta:
+            on_delta(assemble_output(analysis, wrapper, pairs))
+
+    def run_job(i):
+        previous_sentence = sentences[i - 1] if i > 0 else ""
+        return run_chat(client, model, system_text,
+                        build_sentence_prompt(sentences[i], wrapper, previous_sentence, compact_wrapper),
+                        SENTENCE_MAX_TOKENS, use_cache=use_cache, auto_continue=auto_continue)
+
+    def on_result(index, result):
+        nonlocal failed
+        all_results.append(result)
+        i = todo[index]
+        if isinstance(result, dict):
+            line = clean_prompt_line(result["text"])
+            pairs[i]["en"] = prepend_wrapper(wrapper, line) if compact_wrapper else line
+        else:
+            failed += 1
+            pairs[i]["en"] = f"{FAILED_PREFIX}: {result})"
+        if state["first_done"] is None:
+            state["first_done"] = time.perf_counter()
+        done_count[0] += 1
+        if on_progress:
+            on_progress(done_count[0], len(todo))
+        render()
+
+    render()
+    fan_out(run_job, todo, max_workers, on_result=on_result)
+
+    finished = time.perf_counter()
+    ok_results = [r for r in all_results if isinstance(r, dict)]
+    return {
+        "text": assemble_output(analysis, wrapper, pairs),
+        "finish_reason": "stop" if not failed else "error",
+        "model": _answered_models(all_results, model),
+        "fallbacks": sum(1 for r in ok_results if r.get("fallback_from")),
+        "usage": _sum_usage(all_results),
+        "ttft": (state["first_done"] or finished) - started,
+        "latency": finished - started,
+        "cache_hit": False,
+        "calls": sum(1 for r in ok_results if not r.get("cache_hit")),
+        "continuations": sum(r.get("continuations", 0) for r in ok_results),
+        "sentences": len(sentences),
+        "failed": failed,
+        "pairs": pairs,
+        "analysis": analysis,
+        "wrapper": wrapper,
+        "incremental": {"regenerated": len(todo), "reused": reused},
+    }
+
+
+def _dispatch(client, req: dict, on_delta=None, on_pairs=None, on_progress=None, memory=None) -> dict:
+    mode = req["mode"]
+    wrapper = req.get("wrapper", "")
+    compact = req.get("compact_wrapper", False)
+    common = {"use_cache": req["use_cache"], "auto_continue": req["auto_continue"]}
+
+    if mode == "sentence":
+        result = generate_by_sentence(
+            client, req["model"], req["system_text"], req["script"], wrapper=wrapper,
+            compact_wrapper=compact, on_delta=on_delta, on_progress=on_progress, memory=memory, **common
+        )
+    elif mode == "chunk":
+        result = generate_by_chunks(
+            client, req["model"], req["system_text"], req["script"], wrapper=wrapper,
+            compact_wrapper=compact, on_delta=on_delta, on_progress=on_progress, memory=memory, **common
+        )
+    elif mode == "json":
+        result = generate_structured(
+            client, req["model"], req["system_text"], req["user_text"], req["max_tokens"],
+            wrapper=wrapper, compact_wrapper=compact, stream=req["stream"], on_pairs=on_pairs, **common
+        )
+    else:
+        single_on_delta = on_delta
+        if on_delta and compact:
+            def single_on_delta(partial):
+                on_delta(apply_style_wrapper(partial, wrapper))
+        result = run_chat(
+            client, req["model"], req["system_text"], req["user_text"], req["max_tokens"],
+            stream=req["stream"], on_delta=single_on_delta, **common
+        )
+        if compact:
+            result["text"] = apply_style_wrapper(result["text"], wrapper)
+    return result
+
+
+def execute_request(client, req: dict, on_delta=None, on_pairs=None, on_progress=None) -> dict:
+    # 세션 상태 스냅샷(req)만으로 생성을 실행 → 스크립트 스레드와 백그라운드 작업 양쪽에서 같은 경로 사용
+    # req: mode, model, system_text, user_text, script, wrapper, compact_wrapper,
+    #      stream, use_cache, auto_continue, max_tokens, verify, previous(이전 실행의 incremental_base),
+    #      translation_memory, tm_threshold
+    # 번역 메모리 범위는 전체 system_text 해시: 같은 문장이라도 지침(공통 이미지 지침 포함)이 다르면 따로 저장
+    memory = None
+    if req.get("translation_memory"):
+        memory = MemorySession(get_translation_memory(), prompt_cache_key(req["system_text"]),
+                               req.get("tm_threshold", TM_THRESHOLD))
+    result = None
+    # 응답 캐시 우회(use_cache=False)는 "항상 새로 생성"이므로 직전 결과도 재사용하지 않음
+    if req.get("previous") and req["mode"] != "json" and req["use_cache"]:
+        result = generate_incremental(
+            client, req["model"], req["system_text"], req["script"], req["previous"],
+            use_cache=req["use_cache"], auto_continue=req["auto_continue"],
+            compact_wrapper=req.get("compact_wrapper", False), on_delta=on_delta, on_progress=on_progress,
+            memory=memory, mode=req["mode"],
+        )
+    if result is None:
+        # 캐시 우회 시에는 메모리에서 채우지 않고 모든 문장을 새로 생성 (생성 결과는 아래에서 그대로 저장)
+        result = _dispatch(client, req, on_delta=on_delta, on_pairs=on_pairs, on_progress=on_progress,
+                           memory=memory if req["use_cache"] else None)
+    wrapper = req.get("wrapper", "")
+
+    # 단일 호출/JSON 모드는 메모리에서 채우지 않지만, 생성된 문장은 다음 실행을 위해 메모리에 남김
+    # 잘린 출력의 마지막 줄은 불완전할 수 있으므로 저장하지 않음
+    if memory is not None:
+        if result.get("finish_reason") != "length":
+            memory.remember(result.get("pairs") or parse_pairs(result["text"]),
+                            result.get("wrapper") or wrapper or parse_header(result["text"])[1])
+        if memory.lookups:
+            result["tm"] = memory.summary()
+
+    # 다음 실행에서 바뀐 문장만 다시 만들 때 비교할 원본
+    result["source"] = {
+        "script": req["script"],
+        "system_key": prompt_cache_key(req["system_text"]),
+        "model": req["model"],
+        "mode": req["mode"],
+    }
+    result["route"] = req.get("route")
+    # 어떤 버전의 지침 set 으로 만든 결과인지 남김
+    result["instruction_hash"] = req.get("instruction_hash")
+    # 최종 텍스트가 출력 형식 지침(제목/분석/래퍼/두 줄 세트)을 지키는지 검사
+    result["format_issues"] = verify_format(result["text"], wrapper) if req.get("verify") else []
+    return result